@@ -5,10 +5,32 @@ from pptx.enum.dml import MSO_LINE_DASH_STYLE
 from pptx.enum.text import PP_ALIGN, MSO_AUTO_SIZE, MSO_ANCHOR
 from pptx.enum.shapes import MSO_SHAPE
 from pptx.dml.color import RGBColor
-from collections import defaultdict
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+
+try:  # python-pptx internal, see save_presentation
+    from pptx.opc.serialized import _ContentTypesItem
+except ImportError:
+    _ContentTypesItem = None
+from PIL import Image, ImageFont
+from collections import defaultdict, deque
+from functools import lru_cache
+from array import array
+from xml.sax.saxutils import escape
 import os
+import io
+import time
 import copy
+import mmap
+import zipfile
+import struct
 import json
+import base64
+import hashlib
+import math
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import contextvars
 
 # ==============================
 # USER CONFIGURATION (Customize These)
@@ -21,11 +43,38 @@ These values can be customized before running the script.
 """
 
 # --- File / Directory Locations ---
-FILE_INPUT = Path("data/sample_aws_resources.json")  # Set your input JSON file path
+FILE_INPUT = Path(
+    "data/sample_aws_resources.json"
+)  # Set your input JSON file path, or a directory of JSON files (e.g. one per account / region) to merge, or a JSON Lines file (.jsonl) of flattened resources
 FILE_OUTPUT = Path(
     "powerpoint/sample_output.pptx"
 )  # Set your desired Powerpoint output file path
 
+# --- Direct Collection (optional, needs boto3) ---
+COLLECT_REGIONS = None  # Set a list of regions (e.g. ["us-east-1", "eu-west-1"]) to call the AWS describe APIs directly instead of reading FILE_INPUT
+
+# --- Watch Mode ---
+WATCH_INPUT = False  # Keep running and regenerate the output whenever FILE_INPUT (file or directory) changes
+
+# --- Snapshot Diff ---
+FILE_INPUT_PREVIOUS = None  # Set an older input JSON file path to highlight added / removed / moved resources
+
+# --- Extraction Cache ---
+EXTRACT_CACHE_CLEAR = (
+    False  # Set True to drop every cached extraction (.cache/extract/) before the run
+)
+
+# --- Tag Grouping ---
+GROUP_BY_TAG = None  # Set a tag key (e.g. "Environment", "Team") to group items by its value inside their subnet / VPC / AZ
+
+# --- Resource Filter ---
+RESOURCE_FILTER = None  # e.g. {"region": "us-east-1", "vpc": ["vpc-1", "vpc-2"], "item": ["ec2", "rds"], "tag:Environment": "prod"}
+
+# --- Multi Account ---
+ACCOUNT_LEVEL = (
+    False  # Group regions under their AWS account (account_id / OwnerId / ARN)
+)
+
 # --- Content Starting Point ---
 START_LEFT = Inches(0.1)  # Put your content to be generated left value
 START_TOP = Inches(0.1)  # Put your content to be generated height value
@@ -40,6 +89,28 @@ SLIDE_H = Inches(5.48)  # Set your silde height
 PPTX_SLIDE_LAYOUT = 0  # Set your slide layout (Home > Layout), find the layout type number start with 0 (default 15 for Oracle layout type)
 PPTX_FONT_SIZE = Pt(12)  # Set the text font size
 
+# --- Layout Validation ---
+VALIDATE_LAYOUT = True  # Print overlapping shapes, shapes escaping their group and groups exceeding the slide
+PRINT_PROGRESS = False  # Print per-stage progress (regions, groups, nodes)
+
+# --- Level Of Detail ---
+OUTPUT_DETAIL = "full"  # "full": one diagram slide, "overview": region / VPC summary slide linking to per-VPC detail slides
+DETAIL_VPCS = (
+    None  # VPC ids to build detail slides for in "overview" mode (None for all)
+)
+
+# --- Shape Budget ---
+SHAPE_BUDGET = None  # e.g. 10000: estimated shapes per deck above which detail is reduced (item labels dropped, then items counted per subnet, then per VPC)
+
+# --- Sharded Output ---
+OUTPUT_SHARD = None  # "region" or "account": one deck per region / account next to FILE_OUTPUT, FILE_OUTPUT becomes an index deck linking to them
+
+# --- Pipelined Execution ---
+PIPELINE = False  # Extract / lay out / render input files (or regions of one file) as overlapping stages, placed side by side in input order
+
+# --- Output Format ---
+OUTPUT_FORMAT = "pptx"  # "pptx" for PowerPoint, "svg" or "html" for a quick preview next to FILE_OUTPUT
+
 # ==============================
 # INTERNAL CONFIGURATION ( Do Not Modify Unless Needed )
 # ==============================
@@ -47,6 +118,40 @@ PPTX_FONT_SIZE = Pt(12)  # Set the text font size
 DIR_AWS_ICON_ITEM = Path("images/aws_icons/")
 DIR_AWS_ICON_GROUP = Path("images/aws_group_icons/")
 
+# LABEL FITTING (font size & line breaks computed at generation time)
+LABEL_FONT_FILE = None  # TrueType file of the deck font for exact metrics, None for the built-in Calibri table
+LABEL_FONT_CACHE_DIR = Path(".cache/fonts/")
+LABEL_MIN_FONT_SIZE = Pt(7)  # Labels still too long at this size are cut with "…"
+LABEL_FONT_STEP = 0.5  # Points removed per fitting step
+LABEL_LINE_SPACING = 1.2  # Line height / font size (single spacing)
+LABEL_INSET_H = Inches(0.1)  # Text frame insets (python-pptx / PowerPoint defaults)
+LABEL_INSET_V = Inches(0.05)
+LABEL_CHAR_WIDTHS = [
+    # (characters, advance width in em), approximated from Calibri
+    (" ", 0.226),
+    ("ijl|!.,:;'`", 0.23),
+    ('frt()[]{}"-/\\', 0.33),
+    ("IJsz", 0.39),
+    ("acegkvxy*+<=>?", 0.46),
+    ("ELFSTZbdhnopqu0123456789_$#~^", 0.52),
+    ("ABCKPRVXY&%", 0.58),
+    ("DGHNOQU@", 0.63),
+    ("w", 0.715),
+    ("m", 0.8),
+    ("MW", 0.87),
+    ("…", 0.69),
+]
+LABEL_DEFAULT_CHAR_WIDTH = 0.55  # em, characters missing from the table
+LABEL_FIT_CACHE_SIZE = 65536  # Fitted labels kept in memory (fit_label LRU)
+
+# PACKAGE WRITING (save_presentation)
+PPTX_XML_COMPRESS_LEVEL = 6  # Deflate level of XML parts: 1 fastest ... 9 smallest
+PPTX_STORED_EXTS = ("png", "jpg", "jpeg", "gif")  # Already compressed, stored as is
+
+# ICON ASSETS (icons pre-rendered once for their display size)
+ICON_DPI = 150  # Pixels per inch of the embedded icons
+ICON_CACHE_DIR = Path(".cache/icons/")  # Set None to embed the source files as is
+
 # GROUP ICON
 GROUP_ICON_W = Inches(0.35)
 GROUP_ICON_H = Inches(0.35)
@@ -73,6 +178,9 @@ ITEM_W = max(ITEM_ICON_W, ITEM_DESC_TB_W)
 ITEM_H = ITEM_ICON_H + ITEM_GAP_ICON_DESC + ITEM_DESC_TB_H
 
 # ITEM & GROUP STYLING
+# Layout geometry is plain int EMU throughout, divisions use floor division (//).
+# Length values (Inches / Pt) are converted with int() before entering nodes,
+# copy.deepcopy of a Length would re-scale it.
 PAD_H = Inches(0.2)  # Padding Horizontal (left-right)
 PAD_V = Inches(0.25)  # Padding Vertical (top-bottom)
 GAP_H = Inches(0.2)  # Item Gap Horizontal
@@ -92,13 +200,16 @@ ITEM_ICON_MAP = {
 # GROUP BORDER STYLING
 BORDER_COLOR_MAP = {
     "region": RGBColor(0x49, 0xA1, 0xA5),
+    "account": RGBColor(0x23, 0x2F, 0x3E),
     "az": RGBColor(0x49, 0xA1, 0xA5),
     "vpc": RGBColor(0x84, 0x52, 0xF6),
     "private_subnet": RGBColor(0x49, 0xA1, 0xA5),
     "public_subnet": RGBColor(0x82, 0xA0, 0x36),
+    "tag": RGBColor(0x7D, 0x89, 0x98),
     "default": RGBColor(0x00, 0x00, 0x00),
 }
 BORDER_ICON_MAP = {
+    "account": f"{DIR_AWS_ICON_GROUP}/aws_cloud.png",
     "region": f"{DIR_AWS_ICON_GROUP}/region.png",
     "vpc": f"{DIR_AWS_ICON_GROUP}/vpc.png",
     "private_subnet": f"{DIR_AWS_ICON_GROUP}/private_subnet.png",
@@ -108,9 +219,102 @@ BORDER_ICON_MAP = {
 BORDER_DASH_MAP = {
     "region": MSO_LINE_DASH_STYLE.SQUARE_DOT,
     "az": MSO_LINE_DASH_STYLE.DASH,
+    "tag": MSO_LINE_DASH_STYLE.LONG_DASH,
     "default": MSO_LINE_DASH_STYLE.SOLID,
 }
 
+# OVERVIEW (OUTPUT_DETAIL = "overview")
+OVERVIEW_BOX_W = Inches(2.4)
+OVERVIEW_BOX_H = Inches(1.1)
+
+# PREVIEW STYLING (SVG / HTML)
+PREVIEW_EMU_PER_PX = 9525  # 96 DPI
+PREVIEW_LINE_W = 1.25 * 96 / 72  # Border width: 1.25 pt in px
+PREVIEW_DASH_MAP = {
+    MSO_LINE_DASH_STYLE.SQUARE_DOT: "2 2",
+    MSO_LINE_DASH_STYLE.DASH: "6 3",
+    MSO_LINE_DASH_STYLE.LONG_DASH: "10 4",
+    MSO_LINE_DASH_STYLE.SOLID: None,
+}
+
+# SNAPSHOT DIFF STYLING
+DIFF_COLOR_MAP = {
+    "added": RGBColor(0x2E, 0xA0, 0x43),
+    "removed": RGBColor(0xD1, 0x34, 0x38),
+    "moved": RGBColor(0xF0, 0x8C, 0x00),
+}
+
+# LAYOUT CACHE (per region, keyed on the region's mapped nodes)
+LAYOUT_CACHE_DIR = Path(".cache/layout/")
+LAYOUT_CACHE_VERSION = 2  # Bump when the layout calculation changes
+LAYOUT_CACHE_MAX_BYTES = 256 * 1024 * 1024  # LRU region layouts removed above this
+LAYOUT_MEMORY_MAX_BYTES = 64 * 1024 * 1024  # Same, for layouts kept in watch mode
+
+# EXTRACTION CACHE (flat resources per input file, keyed on its content)
+EXTRACT_CACHE_DIR = Path(".cache/extract/")  # Set None to always parse the input
+EXTRACT_CACHE_VERSION = 3  # Bump when extract_resources / extract_connections change
+EXTRACT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Oldest cache files are removed above this
+EXTRACT_CACHE_MAGIC = b"PJXC"
+
+# CONNECTOR STYLING (load balancer -> target)
+CONNECTOR_COLOR = RGBColor(0x7F, 0x7F, 0x7F)
+CONNECTOR_LINE_W = Pt(1)
+
+# NETWORK TOPOLOGY (collected_resources > network)
+# describe_route_tables output, as written by collect_inputs
+NETWORK_ROUTE_TABLE_KEY = "route_table_raw"
+
+# INPUT MERGING
+INPUT_WORKERS = (
+    os.cpu_count() or 1
+)  # Parallel file parsing when FILE_INPUT is a directory
+
+# WATCH MODE
+WATCH_POLL_INTERVAL = 0.5  # Seconds between two scans of FILE_INPUT
+WATCH_DEBOUNCE = 1.0  # Seconds without further writes before regenerating
+
+# SHARDED OUTPUT (OUTPUT_SHARD)
+SHARD_CACHE_DIR = Path(".cache/shards/")  # Content key of each written shard deck
+
+# PROGRESS (set_progress / PRINT_PROGRESS)
+PROGRESS_INTERVAL = 0.5  # Minimum seconds between two events of a stage, first and last events are always sent
+
+# PIPELINE (PIPELINE = True)
+PIPELINE_DEPTH = (
+    4  # Units (files or regions) in flight between the stages, bounds memory
+)
+
+# DIRECT COLLECTION (boto3, AWS credentials from the default chain)
+COLLECT_WORKERS = 16  # Concurrent describe calls across regions and services
+COLLECT_CALLS = [
+    # (collected_resources section, key in section, service, operation, result key)
+    ("ec2", None, "ec2", "describe_instances", "Reservations"),
+    ("ebs", None, "ec2", "describe_volumes", "Volumes"),
+    ("rds", None, "rds", "describe_db_instances", "DBInstances"),
+    ("network", "vpc_raw", "ec2", "describe_vpcs", "Vpcs"),
+    ("network", "subnet_raw", "ec2", "describe_subnets", "Subnets"),
+    (
+        "network",
+        "IGgateway_raw",
+        "ec2",
+        "describe_internet_gateways",
+        "InternetGateways",
+    ),
+    ("network", "sg_raw", "ec2", "describe_security_groups", "SecurityGroups"),
+    ("network", NETWORK_ROUTE_TABLE_KEY, "ec2", "describe_route_tables", "RouteTables"),
+    ("loadbalancer", "lb_raw", "elbv2", "describe_load_balancers", "LoadBalancers"),
+    (
+        "loadbalancer",
+        "lb_target_groups",
+        "elbv2",
+        "describe_target_groups",
+        "TargetGroups",
+    ),
+]
+
+# RESOURCE FILTER (RESOURCE_FILTER keys besides "tag:<Key>")
+RESOURCE_FILTER_FIELDS = ["item", "account", "region", "vpc", "az", "subnet"]
+
 # CALCULATION
 SPECIAL_ITEM_CATE = ["igw"]
 
@@ -123,6 +327,203 @@ def print_json(data: dict, indent: int = 2) -> None:
     print(json.dumps(data, indent=indent))
 
 
+# ==============================
+# PROGRESS FUNCTION
+# ==============================
+class RenderCancelled(Exception):
+    """Raised at the next progress check once the cancellation token is set"""
+
+
+# {"callback", "cancel", "last"} registered by set_progress in the current
+# thread / asyncio task, None when nothing is registered
+progress_state = contextvars.ContextVar("progress_state", default=None)
+
+
+def set_progress(callback=None, cancel=None) -> None:
+    """
+    Register the progress callback and cancellation token used by the next runs
+    (e.g. a service running project() in a thread).
+    - callback(event): event is {"stage", "unit", "done", "total"}, stage in
+      "extract", "group", "layout", "render", "save" and unit in "files",
+      "nodes", "regions", "groups", "parts", "units", "shards"
+    - cancel: a threading.Event (anything with is_set()). Once set, the run
+      raises RenderCancelled at the next check (layout loops included); worker
+      processes finish their current unit and FILE_OUTPUT is left untouched
+    The registration holds for the calling thread only (a ContextVar), so
+    jobs running project() in separate threads do not share it. Worker
+    processes start without callback nor token, progress is reported by the
+    main process as their results arrive.
+    """
+    progress_state.set({"callback": callback, "cancel": cancel, "last": {}})
+
+
+def check_cancel() -> None:
+    """Raise RenderCancelled if the cancellation token is set"""
+    state = progress_state.get()
+    if state is None:
+        return
+    cancel = state["cancel"]
+    if cancel is not None and cancel.is_set():
+        raise RenderCancelled("Render cancelled")
+
+
+def report_progress(stage: str, unit: str, done: int, total: int = None) -> None:
+    """
+    Check the cancellation token, then send the event to the progress callback,
+    at most once per PROGRESS_INTERVAL for a (stage, unit) unless it is the
+    first or the last (done == total) one.
+    """
+    check_cancel()
+    state = progress_state.get()
+    if state is None or state["callback"] is None:
+        return
+
+    now = time.monotonic()
+    last = state["last"].get((stage, unit))
+    if last is not None and done != total and now - last < PROGRESS_INTERVAL:
+        return
+    state["last"][(stage, unit)] = now
+    state["callback"]({"stage": stage, "unit": unit, "done": done, "total": total})
+
+
+def print_progress(event: dict) -> None:
+    """Progress callback of PRINT_PROGRESS"""
+    total = "" if event["total"] is None else f"/{event['total']}"
+    print(f"[{event['stage']}] {event['done']}{total} {event['unit']}")
+
+
+# ==============================
+# COLLECTION FUNCTION
+# ==============================
+def collect_inputs(regions: list, session=None) -> tuple:
+    """
+    Call the AWS describe APIs of every region directly and return the merged
+    (resources, connections) pair, like merge_inputs.
+    - Regions and services are fetched concurrently (asyncio over a thread
+      pool of COLLECT_WORKERS), every paginated call is fully paginated
+    - Each region is rebuilt in the collector's collected_resources shape and
+      extracted as soon as it completes, the raw responses are then dropped
+    - session: a boto3 Session (e.g. one patched by moto), default session if None
+    """
+    try:
+        import boto3
+        from botocore.exceptions import BotoCoreError, ClientError
+    except ImportError:
+        exit("Direct collection (COLLECT_REGIONS) needs boto3: pip install boto3")
+
+    if session is None:
+        session = boto3.session.Session()
+
+    # Regions filtered out are not even requested
+    compiled = compile_resource_filter(RESOURCE_FILTER)
+    regions = [r for r in regions if region_matches(compiled, r)]
+
+    def to_json(value):
+        """Same values as the collector JSON output (datetimes as ISO strings)"""
+        return json.loads(
+            json.dumps(
+                value,
+                default=lambda o: o.isoformat() if hasattr(o, "isoformat") else str(o),
+            )
+        )
+
+    def fetch(region: str, client, operation: str, result_key: str, **kwargs):
+        """Run one describe call with all its pages, in a worker thread"""
+        try:
+            if client.can_paginate(operation):
+                result = []
+                paginator = client.get_paginator(operation)
+                for page in paginator.paginate(**kwargs):
+                    result.extend(page.get(result_key, []))
+                return to_json(result)
+            return to_json(getattr(client, operation)(**kwargs).get(result_key, []))
+        except (BotoCoreError, ClientError) as e:
+            print(f"Collection warning: {region} {operation}: {e}")
+            return []
+
+    async def collect_region(region: str, account_id: str, executor) -> dict:
+        loop = asyncio.get_running_loop()
+        clients = {
+            service: session.client(service, region_name=region)
+            for service in {call[2] for call in COLLECT_CALLS}
+        }
+
+        def run(service: str, operation: str, result_key: str, **kwargs):
+            return loop.run_in_executor(
+                executor,
+                lambda: fetch(
+                    region, clients[service], operation, result_key, **kwargs
+                ),
+            )
+
+        responses = await asyncio.gather(
+            *(run(service, op, key) for _, _, service, op, key in COLLECT_CALLS)
+        )
+
+        collected = {"s3": []}  # Buckets are global, not projected
+        for (section, key, *_), response in zip(COLLECT_CALLS, responses):
+            if key is None:
+                collected[section] = response
+            else:
+                collected.setdefault(section, {})[key] = response
+
+        # Target health needs the target groups first
+        loadbalancer = collected.setdefault("loadbalancer", {})
+        target_groups = loadbalancer.get("lb_target_groups", [])
+        health = await asyncio.gather(
+            *(
+                run(
+                    "elbv2",
+                    "describe_target_health",
+                    "TargetHealthDescriptions",
+                    TargetGroupArn=tg["TargetGroupArn"],
+                )
+                for tg in target_groups
+            )
+        )
+        loadbalancer["lb_target_health"] = [
+            {"TargetGroupArn": tg["TargetGroupArn"], "TargetHealthDescriptions": h}
+            for tg, h in zip(target_groups, health)
+        ]
+
+        return {
+            "region": region,
+            "account_id": account_id,
+            "collected_resources": collected,
+        }
+
+    async def collect_all() -> list:
+        results = [None] * len(regions)
+
+        async def collect_extract(i: int, region: str, account_id: str, executor):
+            region_entry = await collect_region(region, account_id, executor)
+            results[i] = (
+                extract_resources([region_entry]),
+                extract_connections([region_entry]),
+            )
+
+        with ThreadPoolExecutor(max_workers=COLLECT_WORKERS) as executor:
+            loop = asyncio.get_running_loop()
+            try:
+                identity = await loop.run_in_executor(
+                    executor, lambda: session.client("sts").get_caller_identity()
+                )
+                account_id = identity.get("Account")
+            except (BotoCoreError, ClientError) as e:
+                exit(f"AWS credentials not usable: {e}")
+
+            await asyncio.gather(
+                *(
+                    collect_extract(i, region, account_id, executor)
+                    for i, region in enumerate(regions)
+                )
+            )
+        return results
+
+    # Merge in region order, whatever order the regions completed in
+    return merge_extracted(asyncio.run(collect_all()))
+
+
 # ==============================
 # TRANSFORM FUNCTION
 # ==============================
@@ -142,22 +543,198 @@ def load_data(file_path: str) -> list:
     return data
 
 
+def compile_resource_filter(resource_filter: dict) -> dict:
+    """
+    Return RESOURCE_FILTER as {field: set of accepted values}, None if unset.
+    A field accepts one value or a list of values, all fields must match.
+    """
+    if not resource_filter:
+        return None
+
+    result = {}
+    for key, accepted in resource_filter.items():
+        if key not in RESOURCE_FILTER_FIELDS and not key.startswith("tag:"):
+            exit(f"Unknown RESOURCE_FILTER key: {key}")
+        if isinstance(accepted, (list, tuple, set)):
+            result[key] = set(accepted)
+        else:
+            result[key] = {accepted}
+    return result
+
+
+def match_resource(compiled: dict, record: dict, tags: dict = None) -> bool:
+    """
+    Return True if a flat record passes the compiled filter.
+    A missing field or tag never matches. tags defaults to record["tags"].
+    """
+    if tags is None:
+        tags = record.get("tags") or {}
+
+    for key, accepted in compiled.items():
+        if key.startswith("tag:"):
+            value = tags.get(key[4:])
+        else:
+            value = record.get(key)
+        if value not in accepted:
+            return False
+    return True
+
+
+def region_matches(compiled: dict, region: str, account: str = None) -> bool:
+    """
+    Return False if no resource of a region can pass the compiled filter.
+    Only the region, and the account when known at region level, are compared.
+    """
+    if compiled is None:
+        return True
+    if "region" in compiled and region not in compiled["region"]:
+        return False
+    if account and "account" in compiled and account not in compiled["account"]:
+        return False
+    return True
+
+
+def load_resource_lines(file_path: str):
+    """
+    Yield the flattened resources of a JSON Lines file, one record per line
+    (same fields as extract_resources). The file is streamed, never fully loaded.
+    """
+    if not os.path.isfile(file_path):
+        exit(f"File not found: {file_path}")
+
+    compiled = compile_resource_filter(RESOURCE_FILTER)
+
+    with open(file_path, "rb") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                exit(f"Invalid JSON in {file_path} line {line_no}: {e}")
+            if compiled is None or match_resource(compiled, record):
+                yield record
+
+
+def index_network_topology(network: dict) -> dict:
+    """
+    Index the network section in one pass, return {subnet_id: category}
+    with category "public_subnet" or "private_subnet".
+    - A subnet uses its explicitly associated route table, else the VPC main one
+    - A route table with a route to an internet gateway makes the subnet public
+    - Without route tables (NETWORK_ROUTE_TABLE_KEY missing), fall back to
+      MapPublicIpOnLaunch in a VPC with an attached internet gateway, only
+      when both the flag and the internet gateway section were collected
+    Subnets that cannot be classified are left out (plain "subnet" group).
+    """
+    has_igws = "IGgateway_raw" in network
+    igw_ids = set()
+    igw_vpcs = set()
+    for ig in network.get("IGgateway_raw", []):
+        igw_ids.add(ig.get("InternetGatewayId"))
+        for attach in ig.get("Attachments", []):
+            if attach.get("State") == "available":
+                igw_vpcs.add(attach.get("VpcId"))
+
+    def is_igw(gateway_id: str) -> bool:
+        """Internet gateway route, also when the IGWs were not collected"""
+        return gateway_id in igw_ids or (gateway_id or "").startswith("igw-")
+
+    has_route_tables = NETWORK_ROUTE_TABLE_KEY in network
+    public_rtbs = set()
+    subnet_rtb = {}
+    main_rtb = {}
+    for rtb in network.get(NETWORK_ROUTE_TABLE_KEY, []):
+        rtb_id = rtb.get("RouteTableId")
+
+        for route in rtb.get("Routes", []):
+            if is_igw(route.get("GatewayId")):
+                public_rtbs.add(rtb_id)
+                break
+
+        for assoc in rtb.get("Associations", []):
+            if assoc.get("SubnetId"):
+                subnet_rtb[assoc["SubnetId"]] = rtb_id
+            elif assoc.get("Main"):
+                main_rtb[rtb.get("VpcId")] = rtb_id
+
+    result = {}
+    for subnet in network.get("subnet_raw", []):
+        subnet_id = subnet.get("SubnetId")
+        vpc_id = subnet.get("VpcId")
+
+        if has_route_tables:
+            rtb_id = subnet_rtb.get(subnet_id, main_rtb.get(vpc_id))
+            if rtb_id is None:
+                continue  # Route table of the subnet not collected
+            is_public = rtb_id in public_rtbs
+        elif has_igws and "MapPublicIpOnLaunch" in subnet:
+            is_public = bool(subnet["MapPublicIpOnLaunch"]) and vpc_id in igw_vpcs
+        else:
+            continue
+
+        result[subnet_id] = "public_subnet" if is_public else "private_subnet"
+
+    return result
+
+
 def extract_resources(data: list) -> list:
     """
     Convert AWS JSON into a flat list of collected resources (generic).
     Expected output filelds (if available):
-    item, id, name, region, vpc, az, subnet
+    item, id, name, account, region, vpc, az, subnet, subnet_type, tags
+    Tags are parsed once into a {key: value} dict per resource.
+    RESOURCE_FILTER is applied while reading: regions that cannot match are
+    skipped whole, other resources are checked before their record is built.
     """
 
-    def add_result(**item_elements):
+    def add_result(tags: dict = None, **item_elements):
+        if tags:
+            item_elements["tags"] = tags
         result.append(item_elements)
 
+    def keep(tags: dict, item, account, region, vpc, az, subnet) -> bool:
+        """Return True if a resource with these fields passes RESOURCE_FILTER"""
+        if compiled is None:
+            return True
+        fields = {
+            "item": item,
+            "account": account,
+            "region": region,
+            "vpc": vpc,
+            "az": az,
+            "subnet": subnet,
+        }
+        return match_resource(compiled, fields, tags or {})
+
+    def get_tags(tag_list: list) -> dict:
+        """Return AWS [{"Key": k, "Value": v}] tags as {k: v}"""
+        return {tag.get("Key"): tag.get("Value") for tag in tag_list or []}
+
+    def get_arn_account(arn: str) -> str:
+        """Return the account id part of an ARN (arn:aws:service:region:account:...)"""
+        parts = (arn or "").split(":")
+        return parts[4] if len(parts) > 5 and parts[4] else None
+
+    compiled = compile_resource_filter(RESOURCE_FILTER)
+
     result = []
     for region_entry in data:
         region = region_entry.get("region")
+        account = region_entry.get("account_id")
+        if not region_matches(compiled, region, account):
+            continue
+
         collected = region_entry.get("collected_resources", {})  # Collected_resources
+        subnet_types = index_network_topology(collected.get("network", {}))
 
         for item_name, item_data in collected.items():
+            # Sections whose item type is filtered out are not read at all
+            section_item = {"loadbalancer": "elb", "network": "igw"}.get(
+                item_name, item_name
+            )
+            if compiled and section_item not in compiled.get("item", [section_item]):
+                continue
 
             # EC2 items
             if item_name == "ec2":
@@ -169,23 +746,34 @@ def extract_resources(data: list) -> list:
                                 vpc_id = inst.get("VpcId")
                                 subnet_id = inst.get("SubnetId")
                                 az = inst.get("Placement", {}).get("AvailabilityZone")
+                                inst_account = account or ec2_obj.get("OwnerId")
+
+                                tags = get_tags(inst.get("Tags"))
+                                if not keep(
+                                    tags,
+                                    item_name,
+                                    inst_account,
+                                    region,
+                                    vpc_id,
+                                    az,
+                                    subnet_id,
+                                ):
+                                    continue
 
                                 # Default name if no tag
-                                name = None
-                                tags = inst.get("Tags", [])
-                                for tag in tags:
-                                    if tag.get("Key") == "Name":
-                                        name = tag.get("Value")
-                                        break
+                                name = tags.get("Name")
 
                                 add_result(
+                                    tags,
                                     item=item_name,
                                     id=instance_id,
                                     name=name,
+                                    account=inst_account,
                                     region=region,
                                     vpc=vpc_id,
                                     az=az,
                                     subnet=subnet_id,
+                                    subnet_type=subnet_types.get(subnet_id),
                                 )
 
             # RDS items
@@ -196,16 +784,33 @@ def extract_resources(data: list) -> list:
                         "DBInstanceIdentifier"
                     )  # human-readable identifier
                     az = rds_obj.get("AvailabilityZone")
+                    rds_account = account or get_arn_account(
+                        rds_obj.get("DBInstanceArn")
+                    )
+
+                    rds_tags = get_tags(rds_obj.get("TagList"))
 
                     db_subnet_group = rds_obj.get("DBSubnetGroup", {})
                     vpc_id = db_subnet_group.get("VpcId")
                     for subnet in db_subnet_group.get("Subnets", []):
                         subnet_az = subnet.get("SubnetAvailabilityZone", {}).get("Name")
+                        if not keep(
+                            rds_tags,
+                            item_name,
+                            rds_account,
+                            region,
+                            vpc_id,
+                            subnet_az,
+                            None,
+                        ):
+                            continue
                         if subnet_az == az:  # Main AZ
                             add_result(
+                                rds_tags,
                                 item=item_name,
                                 id=rds_id,
                                 name=rds_name,
+                                account=rds_account,
                                 region=region,
                                 vpc=vpc_id,
                                 az=subnet_az,
@@ -213,9 +818,11 @@ def extract_resources(data: list) -> list:
                             )
                         else:
                             add_result(
+                                rds_tags,
                                 item=item_name,
                                 id=f"{rds_id}-{subnet_az}",
                                 name=f"{rds_name}-{subnet_az}",
+                                account=rds_account,
                                 region=region,
                                 vpc=vpc_id,
                                 az=subnet_az,
@@ -228,11 +835,15 @@ def extract_resources(data: list) -> list:
                     lb_id = lb.get("LoadBalancerArn")
                     lb_name = lb.get("LoadBalancerName")
                     vpc_id = lb.get("VpcId")
+                    lb_account = account or get_arn_account(lb_id)
+                    if not keep(None, "elb", lb_account, region, vpc_id, None, None):
+                        continue
 
                     add_result(
                         item="elb",
                         id=lb_id,
                         name=lb_name,
+                        account=lb_account,
                         region=region,
                         vpc=vpc_id,
                         az=None,
@@ -257,9 +868,16 @@ def extract_resources(data: list) -> list:
                     # if name is None:
                     #     name = ig_id
 
+                    ig_tags = get_tags(ig.get("Tags"))
+                    ig_account = account or ig.get("OwnerId")
+                    if not keep(ig_tags, "igw", ig_account, region, vpc_id, None, None):
+                        continue
+
                     add_result(
+                        ig_tags,
                         item="igw",
                         id=ig_id,
+                        account=ig_account,
                         region=region,
                         vpc=vpc_id,
                         az=None,
@@ -269,12 +887,524 @@ def extract_resources(data: list) -> list:
     return result
 
 
+def extract_connections(data: list) -> list:
+    """
+    Convert the loadbalancer section into an edge list of
+    {"source": LoadBalancerArn, "target": target id} (deduplicated).
+    Target groups map to their load balancers, target health lists the targets.
+    Regions filtered out by RESOURCE_FILTER are skipped.
+    """
+    compiled = compile_resource_filter(RESOURCE_FILTER)
+    result = []
+    seen = set()
+
+    for region_entry in data:
+        if not region_matches(
+            compiled, region_entry.get("region"), region_entry.get("account_id")
+        ):
+            continue
+
+        collected = region_entry.get("collected_resources", {})
+        loadbalancer = collected.get("loadbalancer", {})
+
+        tg_to_lbs = {}
+        for tg in loadbalancer.get("lb_target_groups", []):
+            tg_to_lbs[tg.get("TargetGroupArn")] = tg.get("LoadBalancerArns", [])
+
+        for health in loadbalancer.get("lb_target_health", []):
+            lb_arns = tg_to_lbs.get(health.get("TargetGroupArn"), [])
+
+            for desc in health.get("TargetHealthDescriptions", []):
+                target_id = desc.get("Target", {}).get("Id")
+
+                for lb_arn in lb_arns:
+                    edge = (lb_arn, target_id)
+                    if not target_id or edge in seen:
+                        continue
+                    seen.add(edge)
+                    result.append({"source": lb_arn, "target": target_id})
+
+    return result
+
+
+def input_fingerprint(file_path: str, cache_dir: Path) -> str:
+    """
+    Return the sha256 content hash of an input file.
+    The hash is remembered with the file size and mtime, so an untouched file
+    is not read again; a touched file with the same content keeps its hash.
+    """
+    stat = os.stat(file_path)
+    path_key = hashlib.sha256(str(Path(file_path).resolve()).encode("utf-8"))
+    stat_file = Path(cache_dir) / f"{path_key.hexdigest()}.stat"
+
+    try:
+        with open(stat_file, "r") as f:
+            size, mtime_ns, digest = json.load(f)
+        if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+            return digest
+    except (OSError, ValueError):
+        pass
+
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            content_hash.update(chunk)
+    digest = content_hash.hexdigest()
+
+    write_atomic(stat_file, json.dumps([stat.st_size, stat.st_mtime_ns, digest]))
+    return digest
+
+
+def write_atomic(file_path: Path, content) -> None:
+    """Write str / bytes through a temporary file, readers never see half a file"""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb" if isinstance(content, bytes) else "w") as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+
+
+def pack_tables(tables: list) -> bytes:
+    """
+    Encode lists of flat records into a columnar binary buffer.
+    - One string table, every distinct value is stored once (utf-8)
+    - Per table: row / column counts, column name ids, then one uint32 column
+      of string ids per field (0: key missing, 1: None)
+    - Non string values are kept as "\0" + JSON
+    """
+    strings = []
+    string_ids = {}
+
+    def string_id(value) -> int:
+        if not isinstance(value, str):
+            value = "\0" + json.dumps(value)
+        if value not in string_ids:
+            string_ids[value] = len(strings) + 2
+            strings.append(value.encode("utf-8"))
+        return string_ids[value]
+
+    sections = []
+    for rows in tables:
+        columns = list(dict.fromkeys(k for row in rows for k in row))
+        values = array("I")
+        for col in columns:
+            values.extend(
+                0 if col not in row else 1 if row[col] is None else string_id(row[col])
+                for row in rows
+            )
+        names = array("I", [string_id(col) for col in columns])
+        sections.append(struct.pack("<II", len(rows), len(columns)))
+        sections.append(names.tobytes() + values.tobytes())
+
+    offsets = array("Q", [0])
+    for encoded in strings:
+        offsets.append(offsets[-1] + len(encoded))
+    blob = b"".join(strings)
+    padding = b"\0" * (-len(blob) % 4)  # Keep uint32 columns aligned
+
+    header = EXTRACT_CACHE_MAGIC + struct.pack(
+        "<III", EXTRACT_CACHE_VERSION, len(tables), len(strings)
+    )
+    return b"".join([header, offsets.tobytes(), blob, padding] + sections)
+
+
+def unpack_tables(cache_file: Path) -> list:
+    """
+    Memory-map a pack_tables file and return its lists of records.
+    Each distinct string is decoded once. Return None if the file is
+    missing, from another version or damaged.
+    """
+    try:
+        with open(cache_file, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm, memoryview(mm) as view:
+            if view[:4] != EXTRACT_CACHE_MAGIC:
+                return None
+            version, n_tables, n_strings = struct.unpack_from("<III", mm, 4)
+            if version != EXTRACT_CACHE_VERSION:
+                return None
+
+            pos = 16
+            offsets_end = pos + 8 * (n_strings + 1)
+            with view[pos:offsets_end].cast("Q") as offsets:
+                offsets = offsets.tolist()
+            blob_start = offsets_end
+            pos = blob_start + offsets[-1]
+            pos += -pos % 4
+
+            decoded = {}
+
+            def string_value(sid: int):
+                if sid not in decoded:
+                    i = sid - 2
+                    value = str(
+                        view[blob_start + offsets[i] : blob_start + offsets[i + 1]],
+                        "utf-8",
+                    )
+                    decoded[sid] = json.loads(value[1:]) if value[:1] == "\0" else value
+                return decoded[sid]
+
+            tables = []
+            for _ in range(n_tables):
+                n_rows, n_cols = struct.unpack_from("<II", mm, pos)
+                pos += 8
+                with view[pos : pos + 4 * n_cols].cast("I") as names:
+                    columns = [string_value(sid) for sid in names]
+                pos += 4 * n_cols
+
+                rows = [{} for _ in range(n_rows)]
+                for col in columns:
+                    with view[pos : pos + 4 * n_rows].cast("I") as column:
+                        for row, sid in zip(rows, column):
+                            if sid:
+                                row[col] = None if sid == 1 else string_value(sid)
+                    pos += 4 * n_rows
+                tables.append(rows)
+
+            return tables
+    except (OSError, ValueError, IndexError, TypeError, struct.error):
+        return None
+
+
+def trim_cache_dir(cache_dir: Path, max_bytes: int, keep: Path = None) -> None:
+    """Remove the least recently used files until cache_dir fits in max_bytes"""
+    entries = []
+    for cache_file in Path(cache_dir).glob("*"):
+        try:
+            stat = cache_file.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, cache_file))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, cache_file in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        if keep is not None and cache_file == keep:
+            continue
+        try:
+            cache_file.unlink()
+        except OSError:
+            continue
+        total -= size
+
+
+def trim_memory_cache(cache: dict, max_bytes: int) -> None:
+    """
+    Remove the least recently used (first inserted) entries of a {key: str}
+    cache until its values fit in max_bytes.
+    """
+    total = sum(len(v) for v in cache.values())
+    while total > max_bytes and cache:
+        total -= len(cache.pop(next(iter(cache))))
+
+
+def clear_extract_cache(cache_dir: Path = None) -> None:
+    """Explicitly invalidate every cached extraction (default EXTRACT_CACHE_DIR)"""
+    if cache_dir is None:
+        cache_dir = EXTRACT_CACHE_DIR
+    if cache_dir is None:
+        return
+    for cache_file in Path(cache_dir).glob("*"):
+        try:
+            cache_file.unlink()
+        except OSError:
+            pass
+
+
+def extract_file(file_path: str, cache_dir: Path = None) -> tuple:
+    """
+    Load one input file, return its (resources, connections).
+    - The extracted records are cached in cache_dir as a columnar binary file,
+      keyed on the input content (see input_fingerprint) and the extraction
+      settings, later runs memory-map it and skip the JSON parsing
+    - cache_dir defaults to EXTRACT_CACHE_DIR, set that to None to disable
+      the cache
+    """
+    if cache_dir is None:
+        cache_dir = EXTRACT_CACHE_DIR
+
+    if not os.path.isfile(file_path):
+        exit(f"File not found: {file_path}")
+
+    # Already flattened, nothing to extract nor cache
+    if Path(file_path).suffix == ".jsonl":
+        return list(load_resource_lines(file_path)), []
+
+    cache_file = None
+    if cache_dir is not None:
+        key = json.dumps(
+            [
+                EXTRACT_CACHE_VERSION,
+                NETWORK_ROUTE_TABLE_KEY,
+                compile_resource_filter(RESOURCE_FILTER),
+                input_fingerprint(file_path, cache_dir),
+            ],
+            sort_keys=True,
+            default=sorted,
+        )
+        cache_name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        cache_file = Path(cache_dir) / f"{cache_name}.bin"
+
+        cached = unpack_tables(cache_file)
+        if cached is not None:
+            os.utime(cache_file)  # Most recently used
+            return tuple(cached)
+
+    data = load_data(file_path)
+    result = (extract_resources(data), extract_connections(data))
+
+    if cache_file is not None:
+        write_atomic(cache_file, pack_tables(result))
+        trim_cache_dir(cache_dir, EXTRACT_CACHE_MAX_BYTES, keep=cache_file)
+
+    return result
+
+
+def merge_inputs(file_input, memo: dict = None) -> tuple:
+    """
+    Load one file, a directory of JSON / JSONL files or a list of files, and merge
+    them into a single (resources, connections) pair.
+    - Files are parsed in parallel worker processes (INPUT_WORKERS)
+    - Resources are deduplicated through an id index as each file arrives,
+      missing fields are filled from later duplicates
+    - Only extracted records are kept, never the raw JSON of several files
+    - memo: {path: (size, mtime, result)} kept between runs (watch mode),
+      only new or changed files are extracted again; without it, the result
+      of a file is dropped once merged
+    """
+    if isinstance(file_input, (list, tuple)):
+        file_paths = [Path(p) for p in file_input]
+    elif Path(file_input).is_dir():
+        file_paths = sorted(
+            p for p in Path(file_input).iterdir() if p.suffix in (".json", ".jsonl")
+        )
+    else:
+        file_paths = [Path(file_input)]
+
+    if not file_paths:
+        exit(f"No JSON input found in: {file_input}")
+
+    stats = {}
+    for p in file_paths:
+        if not p.is_file():
+            exit(f"File not found: {p}")
+        stat = p.stat()
+        stats[p] = (stat.st_size, stat.st_mtime_ns)
+
+    if memo is None:
+        changed = file_paths
+    else:
+        changed = [p for p in file_paths if memo.get(p, (None,))[:2] != stats[p]]
+    changed_set = set(changed)
+
+    def arrived(results):
+        """Yield the result of each file in input order, as it is extracted"""
+        done = 0
+        for p in file_paths:
+            if p not in changed_set:
+                yield memo[p][2]
+                continue
+            result = next(results)
+            done += 1
+            if memo is not None:
+                memo[p] = stats[p] + (result,)
+            report_progress("extract", "files", done, len(changed))
+            yield result
+
+    if len(changed) <= 1 or INPUT_WORKERS <= 1:
+        return merge_extracted(arrived(map(extract_file, changed)))
+    with ProcessPoolExecutor(
+        max_workers=min(INPUT_WORKERS, len(changed)), initializer=set_progress
+    ) as ex:
+        return merge_extracted(arrived(ex.map(extract_file, changed)))
+
+
+def merge_extracted(results) -> tuple:
+    """
+    Merge an iterable of (resources, connections) pairs as they arrive.
+    Resources are deduplicated through an id index, missing fields are
+    filled from later duplicates. Connections are deduplicated by edge.
+    """
+    resources = []
+    resource_index = {}
+    connections = []
+    connection_index = set()
+
+    for part_resources, part_connections in results:
+        for res in part_resources:
+            existing = resource_index.get(res.get("id"))
+            if existing is None:
+                res = dict(res)  # Filled below, keep the parts untouched
+                resource_index[res.get("id")] = res
+                resources.append(res)
+                continue
+            for k, v in res.items():
+                if existing.get(k) is None and v is not None:
+                    existing[k] = v
+
+        for conn in part_connections:
+            edge = (conn["source"], conn["target"])
+            if edge not in connection_index:
+                connection_index.add(edge)
+                connections.append(conn)
+
+    return resources, connections
+
+
+def estimate_shapes(items: list, connections: list = None) -> int:
+    """
+    Estimate the shapes of the full deck from the flat resources, without
+    mapping them: 3 per group (border, icon, label), 1 per item icon and
+    1 per item label, 1 per connection.
+    """
+    groups = set()
+    shapes = len(connections or [])
+    for item in items:
+        account = item.get("account") if ACCOUNT_LEVEL else None
+        region, vpc, az, subnet = (
+            item.get(k) for k in ("region", "vpc", "az", "subnet")
+        )
+        groups.update([("account", account), ("region", account, region), ("vpc", vpc)])
+        groups.update([("az", account, az), ("subnet", subnet)])
+        tag_value = (item.get("tags") or {}).get(GROUP_BY_TAG)
+        if GROUP_BY_TAG and tag_value and item.get("item") not in SPECIAL_ITEM_CATE:
+            groups.add(("tag", subnet or vpc or az or region, tag_value))
+        shapes += 2 if item.get("name") is not None else 1
+    shapes += 3 * sum(1 for g in groups if g[-1] is not None)
+    return shapes
+
+
+def reduce_detail(items: list, connections: list, level: int) -> tuple:
+    """
+    Return (items, connections) at a lower level of detail:
+    - 1: items without labels
+    - 2: one item per type and parent (subnet, or VPC / AZ), named by its count
+    - 3: as 2 without subnets and AZs, one item per type and VPC (or region)
+    SPECIAL_ITEM_CATE items (e.g. IGWs) are kept as is. Connections follow
+    the counted items, duplicates and self-links are dropped.
+    """
+    if level <= 0:
+        return items, connections
+
+    if level == 1:
+        return [{**item, "name": None} for item in items], connections
+
+    placement = ("account", "region", "vpc", "az", "subnet", "item")
+    if level >= 3:
+        placement = ("account", "region", "vpc", "item")
+
+    result = []
+    counted = {}  # placement -> count item
+    id_map = {}
+    for item in items:
+        if item.get("item") in SPECIAL_ITEM_CATE:
+            result.append(item)
+            continue
+        key = tuple(item.get(k) for k in placement)
+        if key not in counted:
+            count_id = "/".join(str(k) for k in key if k) + "/count"
+            counted[key] = {k: item.get(k) for k in placement}
+            counted[key].update(id=count_id, count=0)
+            if level < 3:
+                counted[key]["subnet_type"] = item.get("subnet_type")
+            result.append(counted[key])
+        counted[key]["count"] += 1
+        id_map[item.get("id")] = counted[key]["id"]
+
+    for count_item in counted.values():
+        count_item["name"] = f"× {count_item.pop('count')}"
+
+    reduced_connections = []
+    edges = set()
+    for conn in connections:
+        edge = (
+            id_map.get(conn["source"], conn["source"]),
+            id_map.get(conn["target"], conn["target"]),
+        )
+        if edge[0] != edge[1] and edge not in edges:
+            edges.add(edge)
+            reduced_connections.append({"source": edge[0], "target": edge[1]})
+
+    return result, reduced_connections
+
+
+def shard_key(item: dict, shard_by: str = None) -> tuple:
+    """
+    Return the OUTPUT_SHARD deck of a flat item: (account,) per account,
+    (account, region) per region (account None without ACCOUNT_LEVEL), or ()
+    for a single deck.
+    """
+    if not shard_by:
+        return ()
+    account = item.get("account") if ACCOUNT_LEVEL else None
+    if shard_by == "account":
+        return (account,)
+    return (account, item.get("region"))
+
+
+def fit_shape_budget(
+    items: list, connections: list, budget: int, shard_by: str = None
+) -> tuple:
+    """
+    Reduce the detail level (reduce_detail) until the estimated shape count
+    of each deck fits the budget. Return (items, connections, {shard key:
+    level}).
+    - shard_by: OUTPUT_SHARD, the budget applies to each shard deck on its
+      own, connections between shards are dropped (shard decks leave them out)
+    Exit when even the lowest detail level exceeds the budget.
+    """
+    shards = defaultdict(list)
+    for item in items:
+        shards[shard_key(item, shard_by)].append(item)
+    item_shard = {
+        item.get("id"): key for key, group in shards.items() for item in group
+    }
+    shard_connections = defaultdict(list)
+    for conn in connections:
+        key = item_shard.get(conn["source"])
+        if not shard_by:
+            shard_connections[()].append(conn)
+        elif key is not None and key == item_shard.get(conn["target"]):
+            shard_connections[key].append(conn)
+
+    result, result_connections, levels = [], [], {}
+    for key, shard_items in shards.items():
+        name = f" ({'/'.join(str(k) for k in key if k) or 'none'})" if key else ""
+        for level in range(4):
+            reduced_items, reduced_connections = reduce_detail(
+                shard_items, shard_connections[key], level
+            )
+            shapes = estimate_shapes(reduced_items, reduced_connections)
+            if shapes <= budget:
+                break
+        else:
+            narrow = "RESOURCE_FILTER" if key else "RESOURCE_FILTER / OUTPUT_SHARD"
+            exit(
+                f"Shape budget {budget}{name} exceeded even at the lowest detail "
+                f"level ({shapes} shapes estimated), raise SHAPE_BUDGET or narrow "
+                f"the input with {narrow}"
+            )
+
+        if level:
+            print(
+                f"Shape budget {budget}{name}: detail level {level} "
+                f"({shapes} shapes estimated)"
+            )
+        result.extend(reduced_items)
+        result_connections.extend(reduced_connections)
+        levels[key] = level
+    return result, result_connections, levels
+
+
 def generate_group_items_mapping(items: list) -> list:
     """
     Transform input list of resources into hierarchical group/item mapping.
     - Duplicates group if needed
     - Keeps original IDs
     - Builds cross-linked sharedGroup for VPC & AZ relationship
+    - With GROUP_BY_TAG, items are grouped by that tag's value inside their
+      parent(s), through an index of (parents, value) -> tag group (linear)
     """
 
     def add_node(
@@ -306,6 +1436,15 @@ def generate_group_items_mapping(items: list) -> list:
     def generate_shared_info(isPrimaryGroup: bool, groupId: list) -> dict:
         return {"isPrimaryGroup": isPrimaryGroup, "groupId": groupId}
 
+    def get_account(item: dict) -> str:
+        return item.get("account") if ACCOUNT_LEVEL else None
+
+    def scoped_id(account: str, group_id: str) -> str:
+        """Region & AZ names repeat across accounts, prefix them with the account"""
+        if account and group_id:
+            return f"{account}/{group_id}"
+        return group_id
+
     result = []
     seen = set()
 
@@ -313,54 +1452,78 @@ def generate_group_items_mapping(items: list) -> list:
     vpc_to_azs = defaultdict(set)
     az_to_vpcs = defaultdict(set)
 
-    for item in items:
-        vpc = item.get("vpc")
-        az = item.get("az")
-        if vpc and az:
-            vpc_to_azs[vpc].add(az)
-            az_to_vpcs[az].add(vpc)
+    # Tag groups by (item parents, tag value)
+    tag_groups = {}
+
+    # sharedGroup groupId lists are filled once every item has been seen,
+    # so items are read in a single pass (they may be streamed)
+    shared_nodes = []
 
     for item in items:
-        region = item.get("region")
+        account = get_account(item)
+        region_name = item.get("region")
+        region = scoped_id(account, region_name)
         vpc = item.get("vpc")
-        az = item.get("az")
+        az_name = item.get("az")
+        az = scoped_id(account, az_name)
         subnet = item.get("subnet")
         iid = item.get("id")
         item_type = item.get("item")
         item_name = item.get("name")
+        subnet_type = item.get("subnet_type") or "subnet"
+
+        # Account
+        if account:
+            add_node(account, "group", "account")
 
         # Region
         if region:
-            add_node(region, "group", "region")
+            add_node(
+                region,
+                "group",
+                "region",
+                generate_data(name=region_name if account else None),
+                parent_ids=[account] if account else None,
+            )
+        az_data = generate_data(name=az_name if account else None)
 
         # VPC & AZ groups with sharedGroup info
         if vpc and az:
+            vpc_to_azs[vpc].add(az)
+            az_to_vpcs[az].add(vpc)
+            if vpc not in seen:
+                shared_nodes.append((vpc, vpc_to_azs))
             add_node(
                 vpc,
                 "group",
                 "vpc",
                 parent_ids=[region] if region else None,
-                shared_info=generate_shared_info(True, sorted(list(vpc_to_azs[vpc]))),
+                shared_info=generate_shared_info(True, []),
             )
+            if az not in seen:
+                shared_nodes.append((az, az_to_vpcs))
             add_node(
                 az,
                 "group",
                 "az",
+                az_data,
                 parent_ids=[region] if region else None,
-                shared_info=generate_shared_info(False, sorted(list(az_to_vpcs[az]))),
+                shared_info=generate_shared_info(False, []),
             )
         else:
             if vpc:
                 add_node(vpc, "group", "vpc", parent_ids=[region] if region else None)
             if az:
-                add_node(az, "group", "az", parent_ids=[region] if region else None)
+                add_node(
+                    az, "group", "az", az_data, parent_ids=[region] if region else None
+                )
 
         # Subnet
         if subnet:
             parents = [pid for pid in [vpc, az] if pid]
             if not parents and region:
                 parents = [region]
-            add_node(subnet, "group", "subnet", parent_ids=parents or None)
+            add_node(subnet, "group", subnet_type, parent_ids=parents or None)
 
         # Items
         parents = []
@@ -373,6 +1536,23 @@ def generate_group_items_mapping(items: list) -> list:
                 parents.append(az)
             if not vpc and not az and region:
                 parents.append(region)
+            if not parents and account:
+                parents.append(account)
+
+        # Tag group between the item and its parent(s)
+        tag_value = (item.get("tags") or {}).get(GROUP_BY_TAG)
+        if GROUP_BY_TAG and tag_value and item_type not in SPECIAL_ITEM_CATE:
+            tag_key = (tuple(parents), tag_value)
+            if tag_key not in tag_groups:
+                tag_groups[tag_key] = f"{'+'.join(parents)}/{GROUP_BY_TAG}={tag_value}"
+                add_node(
+                    tag_groups[tag_key],
+                    "group",
+                    "tag",
+                    generate_data(name=f"{GROUP_BY_TAG}: {tag_value}"),
+                    parent_ids=parents or None,
+                )
+            parents = [tag_groups[tag_key]]
 
         if item_name is not None:
             item_name = item_type + "\n" + item_name
@@ -385,34 +1565,182 @@ def generate_group_items_mapping(items: list) -> list:
             parent_ids=parents or None,
         )
 
+    nodes = {n["id"]: n for n in result}
+    for node_id, pairings in shared_nodes:
+        nodes[node_id]["sharedGroup"]["groupId"] = sorted(pairings[node_id])
+
+    report_progress("group", "nodes", len(result), len(result))
     return result
 
 
-def cal_position_mapping(data: list) -> list:
+def diff_snapshots(old_items: list, new_items: list) -> list:
     """
-    Calculate positions for each group and item based on hierarchy.
-    Return a list with adding position and style (group & shared-group).
+    Compare two extract_resources outputs and return the mapped nodes of both
+    snapshots combined, each tagged with "diff":
+    added / removed / moved (parent changed) / unchanged.
+    Both sides are joined by id through dict indexes.
     """
+    new_ids = {item.get("id") for item in new_items}
+    removed_items = [item for item in old_items if item.get("id") not in new_ids]
+
+    old_parents = {
+        n["id"]: set(n.get("parentId", []))
+        for n in generate_group_items_mapping(old_items)
+    }
+    new_parents = {
+        n["id"]: set(n.get("parentId", []))
+        for n in generate_group_items_mapping(new_items)
+    }
+
+    result = generate_group_items_mapping(new_items + removed_items)
+    for n in result:
+        nid = n["id"]
+        if nid not in old_parents:
+            n["diff"] = "added"
+        elif nid not in new_parents:
+            n["diff"] = "removed"
+        elif old_parents[nid] != new_parents[nid]:
+            n["diff"] = "moved"
+        else:
+            n["diff"] = "unchanged"
 
-    # Helper functions
-    def filter_non_primary_grps() -> list:
-        """
-        - Filter out non primary groups from data.
-        - Modify input data to remove the non primary groups
-        - Usually only AvailabilityZones.
-        """
-        nonlocal data
-        result = []
-        for n in data:
-            shared = n.get("sharedGroup", {})
-            if shared and shared.get("isPrimaryGroup") is False:
-                result.append(n)
-        data = [n for n in data if n not in result]
-        return result
+    return result
 
-    def filter_special_items() -> list:
-        """
-        - Filter out special items that no needed in the group
+
+def build_ancestor_index(data: list) -> dict:
+    """Return {node id: set of all ancestor ids} following every parentId chain"""
+
+    nodes = {n["id"]: n for n in data}
+    result = {}
+    for node_id in nodes:
+        # Post-order over the parent chain with an explicit stack
+        stack = [(node_id, False)]
+        while stack:
+            current, parents_done = stack.pop()
+            parents = [p for p in nodes[current].get("parentId", []) if p in nodes]
+            if not parents_done:
+                if current in result:
+                    continue
+                result[current] = set()  # Guard against cycles
+                stack.append((current, True))
+                stack.extend((p, False) for p in parents if p not in result)
+                continue
+
+            ancestors = set(parents)
+            for pid in parents:
+                ancestors |= result[pid]
+            result[current] = ancestors
+    return result
+
+
+def cal_group_counts(data: list) -> dict:
+    """
+    Return {group id: {item category: count}} for every group, without layout.
+    Each item counts once per ancestor group (its span unit).
+    """
+    ancestors = build_ancestor_index(data)
+    result = defaultdict(lambda: defaultdict(int))
+
+    for n in data:
+        if n["type"] != "item":
+            continue
+        for gid in ancestors[n["id"]]:
+            result[gid][n["category"]] += 1
+
+    return result
+
+
+def sort_siblings(nodes: list) -> list:
+    """
+    Sort a list of nodes within the same hierarchy level based on span and structure rules.
+
+    Sorting logic:
+    1. If all nodes have only a "default" span key:
+        - Primary sort: ascending by number of parentIds (fewer parents first)
+        - Secondary sort: descending by total of "default" span values
+
+    2. Otherwise (mixed span keys present):
+        - Step 1: sort by ascending length of parentIds (fewer parents first)
+        - Step 2: group nodes by type ('group' before 'item')
+        - Step 3: prioritize the first node that has both a non-empty "default" span
+                and additional non-default span keys
+        - Step 4: sort remaining nodes by descending total span value (sum of all span lists)
+        - Step 5: move nodes that only contain "default" spans to the end
+
+    The rules are precomputed once per node into a single composite key.
+    """
+
+    if not nodes:
+        return nodes
+
+    type_order = {"group": 0, "item": 1}  # Lower first, others last
+
+    # One pass over the span of each node: (node, parent count, type order,
+    # total span, only "default" key, "default" + other keys non-empty)
+    facts = []
+    for n in nodes:
+        span = n.get("span", {})
+        keys = span.keys()
+        only_default = len(keys) == 1 and "default" in keys
+        facts.append(
+            (
+                n,
+                len(n.get("parentId", [])),
+                type_order.get(n.get("type", ""), 2),
+                sum(sum(v) for v in span.values() if isinstance(v, list)),
+                only_default,
+                len(keys) > 1 and bool(span.get("default")),
+            )
+        )
+
+    # All have only default span
+    if all(f[4] for f in facts):
+        facts.sort(key=lambda f: (f[1], -f[3]))
+        return [f[0] for f in facts]
+
+    # Mixed spans: the first mixed-span node with non-empty default leads its
+    # (parent count, type) block, then non-default nodes by descending total
+    # span, then only-default nodes in input order (stable sort)
+    first_mixed = next((i for i, f in enumerate(facts) if f[5]), None)
+
+    def sort_key(indexed) -> tuple:
+        i, (_, parents, type_rank, total, only_default, _) = indexed
+        return (
+            parents,
+            type_rank,
+            i != first_mixed,
+            only_default,
+            0 if only_default else -total,
+        )
+
+    return [f[0] for _, f in sorted(enumerate(facts), key=sort_key)]
+
+
+def cal_position_mapping(data: list) -> list:
+    """
+    Calculate positions for each group and item based on hierarchy.
+    Return a list with adding position and style (group & shared-group).
+    """
+
+    # Helper functions
+    def filter_non_primary_grps() -> list:
+        """
+        - Filter out non primary groups from data.
+        - Modify input data to remove the non primary groups
+        - Usually only AvailabilityZones.
+        """
+        nonlocal data
+        result = []
+        for n in data:
+            shared = n.get("sharedGroup", {})
+            if shared and shared.get("isPrimaryGroup") is False:
+                result.append(n)
+        data = [n for n in data if n not in result]
+        return result
+
+    def filter_special_items() -> list:
+        """
+        - Filter out special items that no needed in the group
         - For example, gateways
         """
         nonlocal data
@@ -425,11 +1753,51 @@ def cal_position_mapping(data: list) -> list:
         data = [n for n in data if n not in result]
         return result
 
+    def index_data() -> None:
+        """(Re)build the id and children indexes over data, in data order."""
+        nodes_by_id.clear()
+        children_index.clear()
+        for n in data:
+            add_to_index(n)
+
+    def add_to_index(node) -> None:
+        nodes_by_id[node["id"]] = node
+        for pid in dict.fromkeys(node.get("parentId", [])):
+            children_index[pid].append(node)
+
+    def append_data(node) -> None:
+        """Append a node to data and keep the indexes in sync."""
+        data.append(node)
+        add_to_index(node)
+
     def find_children(node) -> list:
         """Return child(ren) of a node."""
-        nonlocal data
+        return list(children_index.get(node["id"], []))
+
+    def children_extent(node) -> tuple:
+        """
+        Return (right, bottom) of the node's children, memoised per node.
+        Cached extents are translated by shift_subtrees and dropped along the
+        ancestor chain of a moved node (invalidate_extent).
+        """
         node_id = node["id"]
-        return [n for n in data if node_id in n.get("parentId", [])]
+        if node_id not in extent_cache:
+            children = find_children(node)
+            extent_cache[node_id] = (
+                max(c["position"]["left"] + c["style"]["width"] for c in children),
+                max(c["position"]["top"] + c["style"]["height"] for c in children),
+            )
+        return extent_cache[node_id]
+
+    def invalidate_extent(node) -> None:
+        """Drop cached extents of every ancestor of a moved node."""
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            for pid in n.get("parentId", []):
+                if pid in nodes_by_id:
+                    extent_cache.pop(pid, None)
+                    stack.append(nodes_by_id[pid])
 
     def find_siblings(node, required_all: bool = False) -> list:
         """Find siblings of a node that have both position and style."""
@@ -528,114 +1896,12 @@ def cal_position_mapping(data: list) -> list:
 
         return result
 
-    def sort(nodes: list) -> list:
-        """
-        Sort a list of nodes within the same hierarchy level based on span and structure rules.
-
-        Sorting logic:
-        1. If all nodes have only a "default" span key:
-            - Primary sort: ascending by number of parentIds (fewer parents first)
-            - Secondary sort: descending by total of "default" span values
-
-        2. Otherwise (mixed span keys present):
-            - Step 1: sort by ascending length of parentIds (fewer parents first)
-            - Step 2: group nodes by type ('group' before 'item')
-            - Step 3: prioritize the first node that has both a non-empty "default" span
-                    and additional non-default span keys
-            - Step 4: sort remaining nodes by descending total span value (sum of all span lists)
-            - Step 5: move nodes that only contain "default" spans to the end
-        """
-
-        def total_span(node):
-            """Sum of all numbers in all span lists."""
-            span = node.get("span", {})
-            return sum(sum(v) for v in span.values() if isinstance(v, list))
-
-        def has_only_default_span(node):
-            """True if span has only the 'default' key."""
-            span = node.get("span", {})
-            return set(span.keys()) == {"default"}
-
-        def has_mixed_span(node):
-            """True if span has 'default' and at least one other key."""
-            span = node.get("span", {})
-            keys = list(span.keys())
-            return "default" in keys and len(keys) > 1
-
-        def has_nonempty_default(node):
-            """True if 'default' span exists and not empty."""
-            span = node.get("span", {})
-            return bool(span.get("default"))
-
-        def parent_len(node):
-            """Return number of parents (0 if no parentId key)."""
-            return len(node.get("parentId", []))
-
-        def type_order(node):
-            """Lower means higher priority: group < item < others."""
-            t = node.get("type", "")
-            if t == "group":
-                return 0
-            if t == "item":
-                return 1
-            return 2
-
-        if not nodes:
-            return nodes
-
-        only_default_level = all(has_only_default_span(n) for n in nodes)
-
-        # All have only default span
-        if only_default_level:
-            return sorted(nodes, key=lambda n: (parent_len(n), -total_span(n)))
-
-        # Mixed spans
-        # Identify the first mixed-span node with non-empty default
-        first_default_mixed = next(
-            (n for n in nodes if has_mixed_span(n) and has_nonempty_default(n)),
-            None,
-        )
-
-        # Split into groups
-        others = [n for n in nodes if n is not first_default_mixed]
-        only_default_nodes = [n for n in others if has_only_default_span(n)]
-        non_default_nodes = [n for n in others if n not in only_default_nodes]
-
-        # Sort non-default nodes (excluding the "first mixed") by parent len, type, then total span
-        non_default_nodes.sort(
-            key=lambda n: (
-                parent_len(n),
-                type_order(n),
-                -total_span(n),
-            )
-        )
-
-        # Assemble final list
-        ordered = []
-        if first_default_mixed:
-            ordered.append(first_default_mixed)
-        ordered.extend(non_default_nodes)
-        ordered.extend(only_default_nodes)
-
-        # Finally, ensure global priority 1 and 2 applied to entire list
-        # (so parent length and type order still take precedence)
-        return sorted(
-            ordered,
-            key=lambda n: (
-                parent_len(n),
-                type_order(n),
-                (
-                    0 if n is first_default_mixed else 1
-                ),  # 3rd priority: special node first
-            ),
-        )
-
     def get_style(type) -> dict:
-        """Return default style depending on type."""
+        """Return default style depending on type (plain int EMU)."""
         if type == "item":
-            return {"width": ITEM_W, "height": ITEM_H}
+            return {"width": int(ITEM_W), "height": int(ITEM_H)}
         elif type == "group":
-            return {"width": GROUP_W, "height": GROUP_H}
+            return {"width": int(GROUP_W), "height": int(GROUP_H)}
         else:
             raise ValueError(f"Type {type} is not in type list")
 
@@ -740,27 +2006,16 @@ def cal_position_mapping(data: list) -> list:
         ratio = width / height
         return abs(ratio - target_ratio)
 
-    def normalize_types(obj):
-        if isinstance(obj, dict):
-            return {k: normalize_types(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [normalize_types(i) for i in obj]
-        elif isinstance(obj, (float, int)):
-            return int(obj)
-        return obj
-
     def simulate_layout_change(node: dict) -> tuple:
         """
         Reposition children node and generate list of data that calcualted the differences ratio (smaller ratio better layout)
         """
         children = find_children(node)
-        children = normalize_types(children)
 
         if GROUP_TARGET_RATIO >= 1 and len(children) <= 2:
             return False, {}
         elif GROUP_TARGET_RATIO < 1 and len(children) <= 1:
             return False, {}
-        children = copy.deepcopy(children)
 
         # Get most right child node
         most_right_child_node = max(
@@ -769,27 +2024,17 @@ def cal_position_mapping(data: list) -> list:
 
         # Get it's siblings (all parent must match)
         node_siblings_grp = find_siblings(most_right_child_node, True)
-        node_siblings_grp = normalize_types(node_siblings_grp)
-        node_siblings_grp = copy.deepcopy(node_siblings_grp)
         if len(node_siblings_grp) == 0:
             return False, {}
 
         # Get all child position and the node style will be generated
-        n_child_left = copy.deepcopy(
-            normalize_types(most_right_child_node["position"]["left"])
-        )
-        n_child_top = copy.deepcopy(
-            normalize_types(most_right_child_node["position"]["top"])
-        )
+        n_child_left = most_right_child_node["position"]["left"]
+        n_child_top = most_right_child_node["position"]["top"]
         n_child_width = most_right_child_node["style"]["width"]
         n_child_height = most_right_child_node["style"]["height"]
 
         n_width = n_child_left + n_child_width + PAD_H - node["position"]["left"]
-        n_height = (
-            max(c["position"]["top"] + c["style"]["height"] for c in children)
-            + PAD_V
-            - node["position"]["top"]
-        )
+        n_height = children_extent(node)[1] + PAD_V - node["position"]["top"]
 
         # Group siblings by top and sorted
         group_by_top = defaultdict(list)
@@ -840,7 +2085,6 @@ def cal_position_mapping(data: list) -> list:
             simulated_child_bottom = simulated_child_top + n_child_height
 
             simulated_children = remove_node(children, [most_right_child_node])
-            simulated_children = normalize_types(simulated_children)
             simulated_children = copy.deepcopy(simulated_children)
 
             # Get list of widhts and heights
@@ -899,81 +2143,117 @@ def cal_position_mapping(data: list) -> list:
                 "child_siblings_offset_top_move": child_siblings_top_moving_after_child,
             }
 
-    def shift_node(node: dict, dx: int, dy: int) -> None:
-        """Shift the node and its children."""
-        node["position"]["left"] += dx
-        node["position"]["top"] += dy
+    def shift_subtrees(offsets: list) -> None:
+        """
+        Shift each (node, dx, dy) together with its subtree.
+        Explicit stack, every node of a subtree is offset once.
+        """
+        for node, dx, dy in offsets:
+            if not dx and not dy:
+                continue
+
+            stack = [node]
+            visited = set()
+            while stack:
+                n = stack.pop()
+                if n["id"] in visited:
+                    continue
+                visited.add(n["id"])
+
+                n["position"]["left"] += dx
+                n["position"]["top"] += dy
+
+                # The whole subtree moves, cached extents move with it
+                if n["id"] in extent_cache:
+                    right, bottom = extent_cache[n["id"]]
+                    extent_cache[n["id"]] = (right + dx, bottom + dy)
 
-        for c in find_children(node):
-            shift_node(c, dx, dy)
+                stack.extend(children_index.get(n["id"], []))
+
+            invalidate_extent(node)
 
     # Main Functions
-    def cal_grouping(node) -> int:
+    def cal_grouping(root) -> int:
         """
         Return integer span units for node
         The returned span is an integer >= 1
         Also, group them in sharedGroups
+        Post-order traversal with an explicit stack (no recursion limit)
         """
-        # Single item is 1 unit
-        if node["type"] == "item":
-            return 1
 
-        # Recursively compute child spans
-        children = find_children(node)
-        spans = {}
-
-        # Detect shared group
-        shared_groups = []
-        spans = {"default": []}
-        if "sharedGroup" in node and node["sharedGroup"]:
-            shared_groups = node["sharedGroup"].get("groupId", [])
-            for sg in shared_groups:
-                spans[sg] = []
-
-        # Process children
-        child_span = []
-        for child in children:
-            child_span = cal_grouping(child)
-
-            # Decide which span bucket to add into
-            added = False
-            if shared_groups:
+        def get_span(node) -> int:
+            # Single item is 1 unit
+            if node["type"] == "item":
+                return 1
+            return span_cache[node["id"]]
+
+        stack = [(root, False)]
+        while stack:
+            node, children_done = stack.pop()
+
+            # Shared subtrees are reached once per parent, compute them once
+            if node["type"] == "item" or node["id"] in span_cache:
+                continue
+
+            children = find_children(node)
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+
+            # Detect shared group
+            shared_groups = []
+            spans = {"default": []}
+            if "sharedGroup" in node and node["sharedGroup"]:
+                shared_groups = node["sharedGroup"].get("groupId", [])
                 for sg in shared_groups:
-                    if sg in child.get("parentId", []):
-                        spans[sg].append(child_span)
-                        added = True
-                        break
+                    spans[sg] = []
+
+            # Process children
+            for child in children:
+                child_span = get_span(child)
+
+                # Decide which span bucket to add into
+                added = False
+                if shared_groups:
+                    for sg in shared_groups:
+                        if sg in child.get("parentId", []):
+                            spans[sg].append(child_span)
+                            added = True
+                            break
 
-            if not added:
-                spans["default"].append(child_span)
+                if not added:
+                    spans["default"].append(child_span)
 
-        # Compute total span (sum of all child spans)
-        total_span = sum(sum(v) for v in spans.values())
-        node["span"] = spans
+            # Compute total span (sum of all child spans)
+            node["span"] = spans
+            span_cache[node["id"]] = sum(sum(v) for v in spans.values())
 
-        return total_span
+        return get_span(root)
 
     def layout_node(node, left, top, depth: int = 0) -> None:
         """
-        Set the layout of the node
+        Set the layout of the node and its subtree.
+        Explicit stack of frames (node, sorted children, next child index, depth):
+        a child is placed once its previous siblings are fully laid out, a node
+        is finished (improvement loop & size) once all its children are.
         """
 
-        node["position"] = {"left": left, "top": top}
-        node["style"] = get_style(node.get("type", None))
-
-        children = find_children(node)
-        if not children:  # Always item
-            return
-
-        children = sort(children)
+        def start_node(node, left, top, depth) -> None:
+            node["position"] = {"left": left, "top": top}
+            node["style"] = get_style(node.get("type", None))
 
-        for child in children:
+            children = find_children(node)
+            if not children:  # Always item
+                return
 
-            child_type = child.get("type")
+            stack.append([node, sort_siblings(children), 0, depth])
 
+        def place_child(node, child) -> tuple:
+            """Return the (left, top) of the next child from its laid out siblings."""
             # For first child -> children[0]
-            child_left = left + PAD_H
-            child_top = top + PAD_V
+            child_left = node["position"]["left"] + PAD_H
+            child_top = node["position"]["top"] + PAD_V
 
             # Siblings are all the same parentId
             siblings_grp = find_siblings(child, True)
@@ -984,9 +2264,6 @@ def cal_position_mapping(data: list) -> list:
             # Siblings from parent's neighbour
             siblings_neighbour_grp = find_neighbour_siblings(child)
 
-            # Assign variable for the groups compare
-            grp = None
-
             # horizontal expand first
             if len(siblings_grp) > 0:
                 child_top = max(s["position"]["top"] for s in siblings_grp)
@@ -996,6 +2273,16 @@ def cal_position_mapping(data: list) -> list:
 
             elif len(siblings_neighbour_grp) > 0:
                 child_top = min(s["position"]["top"] for s in siblings_neighbour_grp)
+                # Align with the neighbour row, never over a taller previous sibling
+                if len(siblings_primary_grp) > 0:
+                    child_top = max(
+                        child_top,
+                        GAP_V
+                        + max(
+                            s["position"]["top"] + s["style"]["height"]
+                            for s in siblings_primary_grp
+                        ),
+                    )
 
             elif len(siblings_primary_grp) > 0:
                 child_top = GAP_V + max(
@@ -1003,43 +2290,70 @@ def cal_position_mapping(data: list) -> list:
                     for s in siblings_primary_grp
                 )
 
-            layout_node(child, child_left, child_top, depth + 1)
-
-        if depth > 0 and len(children) > 1:
-            # simulate_layout_change return dict of the most right node may need
-            node_has_better_pos, node_detail = simulate_layout_change(node)
-
-            while node_has_better_pos:
-                for c in children:
-                    if c["id"] == node_detail["child_nid"]:
-                        c["position"]["left"] = node_detail["pos_left"]
-                        c["position"]["top"] = node_detail["pos_top"]
-                        continue
-
-                    if (
-                        node_detail["child_siblings_offset_top_move"] > 0
-                        and node_detail["pos_top"] < c["position"]["top"]
-                    ):
-                        shift_node(c, 0, node_detail["child_siblings_offset_top_move"])
-
-                    if (
-                        node_detail["add_new_row"]
-                        and c["position"]["top"] >= node_detail["pos_top"]
-                    ):
-                        shift_node(c, 0, node_detail["child_height"] + GAP_V)
+            return child_left, child_top
 
+        def finish_node(node, children, depth) -> None:
+            if depth > 0 and len(children) > 1:
+                # simulate_layout_change return dict of the most right node may need
                 node_has_better_pos, node_detail = simulate_layout_change(node)
 
-        node["style"]["width"] = (
-            max(c["position"]["left"] + c["style"]["width"] for c in children)
-            + PAD_H
-            - (node["position"]["left"] if len(children) > 0 else 0)
-        )
-        node["style"]["height"] = (
-            max(c["position"]["top"] + c["style"]["height"] for c in children)
-            + PAD_V
-            - (node["position"]["top"] if len(children) > 0 else 0)
-        )
+                while node_has_better_pos:
+                    check_cancel()
+                    offsets = []
+                    for c in children:
+                        if c["id"] == node_detail["child_nid"]:
+                            offsets.append(
+                                (
+                                    c,
+                                    node_detail["pos_left"] - c["position"]["left"],
+                                    node_detail["pos_top"] - c["position"]["top"],
+                                )
+                            )
+                            continue
+
+                        c_top = c["position"]["top"]
+                        dy = 0
+                        if (
+                            node_detail["child_siblings_offset_top_move"] > 0
+                            and node_detail["pos_top"] < c_top
+                        ):
+                            dy += node_detail["child_siblings_offset_top_move"]
+
+                        if (
+                            node_detail["add_new_row"]
+                            and c_top + dy >= node_detail["pos_top"]
+                        ):
+                            dy += node_detail["child_height"] + GAP_V
+
+                        offsets.append((c, 0, dy))
+
+                    shift_subtrees(offsets)
+                    node_has_better_pos, node_detail = simulate_layout_change(node)
+
+            right, bottom = children_extent(node)
+            node["style"]["width"] = right + PAD_H - node["position"]["left"]
+            node["style"]["height"] = bottom + PAD_V - node["position"]["top"]
+
+            if node["type"] == "group":
+                progress["groups"] += 1
+                report_progress("layout", "groups", progress["groups"], group_count)
+
+        stack = []
+        start_node(node, left, top, depth)
+
+        while stack:
+            frame = stack[-1]
+            node, children, index, depth = frame
+
+            if index < len(children):
+                frame[2] += 1
+                child = children[index]
+                child_left, child_top = place_child(node, child)
+                start_node(child, child_left, child_top, depth + 1)
+                continue
+
+            stack.pop()
+            finish_node(node, children, depth)
 
     def layout_non_primary_groups(groups: list) -> None:
 
@@ -1066,12 +2380,12 @@ def cal_position_mapping(data: list) -> list:
 
             grp_height = (
                 max(c["position"]["top"] + c["style"]["height"] for c in children)
-                + PAD_V / 2
+                + PAD_V // 2
                 - pos_top
             )
             grp_width = (
                 max(c["position"]["left"] + c["style"]["width"] for c in children)
-                + PAD_H / 2
+                + PAD_H // 2
                 - pos_left
             )
 
@@ -1081,26 +2395,26 @@ def cal_position_mapping(data: list) -> list:
             left_collections[pos_left].append(grp)
             top_collections[pos_top].append(grp)
 
-            data.append(grp)
+            append_data(grp)
 
         left_collections = dict(sorted(left_collections.items()))
         top_collections = dict(sorted(top_collections.items()))
 
         for pos, grp_nodes in left_collections.items():
-            move(pos, left=PAD_H / 2, exception=grp_nodes)
-            add_style(grp_nodes, width=PAD_H / 2)
+            move(pos, left=PAD_H // 2, exception=grp_nodes)
+            add_style(grp_nodes, width=PAD_H // 2)
 
             for node in grp_nodes:
                 n_width = node["style"]["width"]
-                move(pos + n_width, left=PAD_H / 2)
+                move(pos + n_width, left=PAD_H // 2)
 
         for pos, grp_nodes in top_collections.items():
-            move(pos, top=PAD_V / 2, exception=grp_nodes)
-            add_style(grp_nodes, height=PAD_V / 3)
+            move(pos, top=PAD_V // 2, exception=grp_nodes)
+            add_style(grp_nodes, height=PAD_V // 3)
 
             for node in grp_nodes:
                 n_height = node["style"]["height"]
-                move(pos + n_height, top=PAD_V / 2)
+                move(pos + n_height, top=PAD_V // 2)
 
     def layout_special_items(items: list) -> None:
 
@@ -1136,30 +2450,41 @@ def cal_position_mapping(data: list) -> list:
             i = 1
             for s_it in s_items:
                 pos_left = (
-                    n_start + ((n_end - n_start) / (s_items_len + 1) * i) - (ITEM_W / 2)
+                    n_start + (n_end - n_start) * i // (s_items_len + 1) - ITEM_W // 2
                 )
-                pos_top = n_top - (ITEM_ICON_H / 2)
+                pos_top = n_top - ITEM_ICON_H // 2
 
                 s_it["position"] = {"left": pos_left, "top": pos_top}
-                s_it["style"] = {"width": ITEM_W, "height": ITEM_H}
+                s_it["style"] = {"width": int(ITEM_W), "height": int(ITEM_H)}
 
-                data.append(s_it)
+                append_data(s_it)
                 i += 1
 
     # Filter out non primary groups and special items
     non_primary_grps = filter_non_primary_grps()
     special_items = filter_special_items()
 
+    # Indexes & memoised spans / children extents
+    nodes_by_id = {}
+    children_index = defaultdict(list)
+    span_cache = {}
+    extent_cache = {}
+    index_data()
+
+    # Groups laid out, for the progress events
+    progress = {"groups": 0}
+    group_count = sum(1 for n in data if n["type"] == "group")
+
     # Find root item
     root_nodes = [n for n in data if not n.get("parentId")]
 
     for root in root_nodes:
         cal_grouping(root)
 
-    root_nodes = sort(root_nodes)
+    root_nodes = sort_siblings(root_nodes)
 
-    current_top = START_TOP
-    current_left = START_LEFT
+    current_top = int(START_TOP)
+    current_left = int(START_LEFT)
 
     for root in root_nodes:
         layout_node(node=root, left=current_left, top=current_top)
@@ -1171,24 +2496,707 @@ def cal_position_mapping(data: list) -> list:
     return data
 
 
-def generate_pptx(data: list) -> None:
+def layout_settings() -> list:
+    """Return the settings a layout depends on (layout and shard cache keys)"""
+    return [
+        LAYOUT_CACHE_VERSION,
+        START_LEFT,
+        START_TOP,
+        ITEM_W,
+        ITEM_H,
+        GROUP_W,
+        GROUP_H,
+        PAD_H,
+        PAD_V,
+        GAP_H,
+        GAP_V,
+        GROUP_TARGET_RATIO,
+        SPECIAL_ITEM_CATE,
+    ]
+
+
+def cal_region_position_mapping(
+    data: list, cache_dir: Path = None, memory_cache: dict = None
+) -> list:
     """
-    Generate Powerpoint shapes from data then save
+    Run cal_position_mapping per root (region) and place the roots side by side.
+    - Each region layout is cached on disk, keyed on its mapped nodes and the
+      layout settings: a region identical to one laid out by any earlier run
+      is reused. The directory is capped by LAYOUT_CACHE_MAX_BYTES (LRU)
+    - cache_dir defaults to LAYOUT_CACHE_DIR, set that to None to disable
+      the cache
+    - memory_cache: {key: cached layout} kept in process between runs (watch
+      mode), capped by LAYOUT_MEMORY_MAX_BYTES (LRU)
     """
+    if cache_dir is None:
+        cache_dir = LAYOUT_CACHE_DIR
+
+    layout_keys = ("id", "type", "category", "data", "parentId", "sharedGroup")
+    settings = layout_settings()
+
+    def find_root(node: dict) -> str:
+        """Follow the first parentId up to the root, memoised"""
+        nid = node["id"]
+        if nid not in roots:
+            roots[nid] = nid  # Guard against cycles
+            parent_ids = [pid for pid in node.get("parentId", []) if pid in nodes]
+            if parent_ids:
+                roots[nid] = find_root(nodes[parent_ids[0]])
+        return roots[nid]
+
+    def region_key(region_nodes: list) -> str:
+        layout_input = [{k: n[k] for k in layout_keys if k in n} for n in region_nodes]
+        buffer = json.dumps([settings, layout_input], sort_keys=True)
+        return hashlib.sha256(buffer.encode("utf-8")).hexdigest()
+
+    def layout_region(region_nodes: list) -> list:
+        """Return the positioned nodes of a region, from cache if available"""
+        key = region_key(region_nodes)
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = Path(cache_dir) / f"{key}.json"
+
+        cached = None
+        if memory_cache is not None and key in memory_cache:
+            memory_cache[key] = memory_cache.pop(key)  # Most recently used
+            cached = json.loads(memory_cache[key])
+        elif cache_file is not None and cache_file.is_file():
+            with open(cache_file, "r") as f:
+                buffer = f.read()
+            os.utime(cache_file)  # Most recently used
+            cached = json.loads(buffer)
+            if memory_cache is not None:
+                memory_cache[key] = buffer
+
+        if cached is not None:
+            by_id = {n["id"]: n for n in region_nodes}
+            result = []
+            for entry in cached:
+                n = by_id[entry.pop("id")]
+                n.update(entry)
+                result.append(n)
+            return result
+
+        result = cal_position_mapping(region_nodes)
+
+        cached = [
+            {
+                k: n[k]
+                for k in ("id", "position", "style", "span")
+                if k in n and n[k] is not None
+            }
+            for n in result
+        ]
+        if memory_cache is not None:
+            memory_cache[key] = json.dumps(cached)
+        if cache_file is not None:
+            write_atomic(cache_file, json.dumps(cached))
+            written.append(cache_file)
+
+        return result
+
+    def total_span(node: dict) -> int:
+        return sum(sum(v) for v in node.get("span", {}).values())
+
+    nodes = {n["id"]: n for n in data}
+    roots = {}
+    regions = defaultdict(list)
+    for n in data:
+        regions[find_root(n)].append(n)
+
+    laid_out = []
+    written = []
+    for i, (root_id, region_nodes) in enumerate(regions.items(), 1):
+        laid_out.append((nodes[root_id], layout_region(region_nodes)))
+        report_progress("layout", "regions", i, len(regions))
+    if written:
+        trim_cache_dir(cache_dir, LAYOUT_CACHE_MAX_BYTES)
+    if memory_cache is not None:
+        trim_memory_cache(memory_cache, LAYOUT_MEMORY_MAX_BYTES)
+
+    # Group roots first, then larger spans first (same as root sorting)
+    laid_out.sort(key=lambda r: (r[0]["type"] != "group", -total_span(r[0])))
+
+    result = []
+    current_left = START_LEFT
+    for root, region_nodes in laid_out:
+        dx = current_left - START_LEFT
+        for n in region_nodes:
+            n["position"]["left"] += dx
+        result.extend(region_nodes)
+        current_left += root["style"]["width"] + GAP_H
+
+    return result
+
+
+def node_box(node: dict) -> tuple:
+    """
+    Return the visible (left, top, right, bottom) box of a positioned node.
+    Items without a label only occupy their icon.
+    """
+    left = node["position"]["left"]
+    top = node["position"]["top"]
+
+    if node["type"] == "item" and not node.get("data", {}).get("name"):
+        left += ITEM_W // 2 - ITEM_ICON_W // 2
+        return (left, top, left + ITEM_ICON_W, top + ITEM_ICON_H)
+
+    return (left, top, left + node["style"]["width"], top + node["style"]["height"])
+
+
+def grid_cells(box: tuple, cell_w: int, cell_h: int):
+    """Yield the (column, row) uniform grid cells covered by a box"""
+    left, top, right, bottom = box
+    for col in range(int(left // cell_w), int(right // cell_w) + 1):
+        for row in range(int(top // cell_h), int(bottom // cell_h) + 1):
+            yield (col, row)
+
+
+def build_spatial_grid(boxes: dict, cell_w: int, cell_h: int) -> dict:
+    """
+    Bucket boxes ({key: (left, top, right, bottom)}) into a uniform grid.
+    Return {(column, row): [key, ...]}
+    """
+    grid = defaultdict(list)
+    for key, box in boxes.items():
+        for cell in grid_cells(box, cell_w, cell_h):
+            grid[cell].append(key)
+    return grid
+
+
+def validate_layout(data: list) -> list:
+    """
+    Check the final positions, return a list of issues:
+    - overlap: two shapes intersect and neither contains the other by hierarchy
+    - escape: a node is not inside one of its parent groups
+    - slide_bounds: a group exceeds the slide area
+    Candidates are bucketed in a uniform grid (item sized cells), so only
+    shapes sharing a cell are compared.
+    """
+
+    def contains(outer: tuple, inner: tuple) -> bool:
+        return (
+            outer[0] <= inner[0]
+            and outer[1] <= inner[1]
+            and inner[2] <= outer[2]
+            and inner[3] <= outer[3]
+        )
+
+    def add_issue(check: str, ids: list, message: str) -> None:
+        issues.append({"check": check, "ids": ids, "message": message})
+
+    issues = []
+    nodes = {n["id"]: n for n in data if "position" in n and "style" in n}
+    boxes = {nid: node_box(n) for nid, n in nodes.items()}
+    ancestors = build_ancestor_index(list(nodes.values()))
+
+    # Parent escape, special items sit on their group border by design
+    for nid, n in nodes.items():
+        if n["type"] == "item" and n["category"] in SPECIAL_ITEM_CATE:
+            continue
+        for pid in n.get("parentId", []):
+            if pid in boxes and not contains(boxes[pid], boxes[nid]):
+                add_issue("escape", [nid, pid], f"{nid} escapes parent {pid}")
+
+    # Slide bounds, only the outermost exceeding group is reported
+    slide_box = (START_LEFT, START_TOP, START_LEFT + SLIDE_W, START_TOP + SLIDE_H)
+    exceeding = {
+        nid
+        for nid, n in nodes.items()
+        if n["type"] == "group" and not contains(slide_box, boxes[nid])
+    }
+    for nid in nodes:
+        if nid in exceeding and not any(
+            pid in exceeding for pid in nodes[nid].get("parentId", [])
+        ):
+            add_issue("slide_bounds", [nid], f"{nid} exceeds the slide bounds")
+
+    # Overlap, non primary groups span across others by design
+    candidates = {
+        nid: box
+        for nid, box in boxes.items()
+        if nodes[nid].get("sharedGroup", {}).get("isPrimaryGroup", True)
+    }
+    cell_w, cell_h = ITEM_W, ITEM_H
+    grid = build_spatial_grid(candidates, cell_w, cell_h)
+
+    for cell, keys in grid.items():
+        for i, a in enumerate(keys):
+            box_a = candidates[a]
+            for b in keys[i + 1 :]:
+                box_b = candidates[b]
+                left = max(box_a[0], box_b[0])
+                top = max(box_a[1], box_b[1])
+                if left >= min(box_a[2], box_b[2]) or top >= min(box_a[3], box_b[3]):
+                    continue
+
+                # Report once, from the cell holding the intersection's corner
+                if (int(left // cell_w), int(top // cell_h)) != cell:
+                    continue
+
+                if a in ancestors[b] or b in ancestors[a]:
+                    continue
+
+                add_issue("overlap", [a, b], f"{a} overlaps {b}")
+
+    return issues
+
+
+def route_connections(data: list, connections: list) -> list:
+    """
+    Route each connection as an orthogonal polyline between item icons.
+    Return a list of {"source", "target", "points": [(left, top), ...],
+    "crossings": [ids of the boxes the route still passes through]}.
+    - Candidate routes: L shapes (horizontal or vertical first) and Z shapes
+      through the quarter / middle lines or the gaps around the end groups
+    - Obstacles are the other items, every group label (icon and fitted text)
+      and the groups that contain neither end (a route stays inside the groups it connects).
+      Items and labels are bucketed in an item sized grid, groups in a coarser
+      one, so a segment is only tested against the boxes in the cells it crosses
+    - The candidate crossing the fewest items / labels wins, then the fewest
+      groups, then the shortest
+    - With VALIDATE_LAYOUT, routes that could not avoid every obstacle are
+      reported, their count is printed
+    """
+
+    def icon_center(node: dict) -> tuple:
+        left = node["position"]["left"] + ITEM_W // 2
+        top = node["position"]["top"] + ITEM_ICON_H // 2
+        return (left, top)
+
+    def segment_hits(a: tuple, b: tuple, grid, cell_w, cell_h, excluded) -> set:
+        """Return the keys of the grid boxes the segment a -> b passes through"""
+        seg = (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+        hits = set()
+        for cell in grid_cells(seg, cell_w, cell_h):
+            for key in grid.get(cell, []):
+                if key in excluded or key in hits:
+                    continue
+                box = boxes[key]
+                if (
+                    seg[0] < box[2]
+                    and box[0] < seg[2]
+                    and seg[1] < box[3]
+                    and box[1] < seg[3]
+                ):
+                    hits.add(key)
+        return hits
+
+    def clip_to_icon(center: tuple, toward: tuple) -> tuple:
+        """Move an end point from the icon center to the icon border"""
+        if center[0] == toward[0]:  # Vertical segment
+            dy = ITEM_ICON_H // 2 if toward[1] > center[1] else -(ITEM_ICON_H // 2)
+            return (center[0], center[1] + dy)
+        dx = ITEM_ICON_W // 2 if toward[0] > center[0] else -(ITEM_ICON_W // 2)
+        return (center[0] + dx, center[1])
+
+    if not connections:
+        return []
+
+    positioned = [n for n in data if "position" in n and "style" in n]
+    nodes = {n["id"]: n for n in positioned if n["type"] == "item"}
+    ancestors = build_ancestor_index(positioned)
+
+    widths = font_metrics()
+    boxes = {}  # key: (left, top, right, bottom)
+    group_boxes = {}
+    for n in positioned:
+        left, top = n["position"]["left"], n["position"]["top"]
+        if n["type"] == "item":
+            boxes[n["id"]] = node_box(n)
+            continue
+        group_boxes[n["id"]] = (
+            left,
+            top,
+            left + n["style"]["width"],
+            top + n["style"]["height"],
+        )
+        # Label box shrunk to the fitted text
+        size, paragraphs = fit_label(
+            n.get("data", {}).get("name", n["id"]), GROUP_LABEL_TB_W, GROUP_LABEL_TB_H
+        )
+        text_em = max(
+            sum(widths.get(c, LABEL_DEFAULT_CHAR_WIDTH) for c in line)
+            for lines in paragraphs
+            for line in lines
+        )
+        label_right = left + int(text_em * size * 12700) + LABEL_INSET_H * 2
+        if BORDER_ICON_MAP.get(n["category"].lower(), BORDER_ICON_MAP["default"]):
+            label_right += GROUP_ICON_W + GROUP_GAP_ICON_LABEL
+        boxes[("label", n["id"])] = (left, top, label_right, top + GROUP_LABEL_TB_H)
+    cell_w, cell_h = ITEM_W, ITEM_H
+    grid = build_spatial_grid(boxes, cell_w, cell_h)
+    boxes.update(group_boxes)
+    group_cell_w, group_cell_h = ITEM_W * 8, ITEM_H * 8
+    group_grid = build_spatial_grid(group_boxes, group_cell_w, group_cell_h)
+
+    result = []
+    blocked = 0
+    for conn in connections:
+        source = nodes.get(conn["source"])
+        target = nodes.get(conn["target"])
+        if source is None or target is None:
+            continue
+
+        (sx, sy), (tx, ty) = icon_center(source), icon_center(target)
+        candidates = [
+            [(sx, sy), (tx, sy), (tx, ty)],
+            [(sx, sy), (sx, ty), (tx, ty)],
+        ]
+        # Z shapes through the middle and quarter lines, then through the
+        # gaps just outside the groups holding either end (enter from a side)
+        xs = [sx + (tx - sx) * f // 4 for f in (2, 1, 3)]
+        ys = [sy + (ty - sy) * f // 4 for f in (2, 1, 3)]
+        for node in (source, target):
+            for pid in node.get("parentId", []):
+                if pid in group_boxes:
+                    left, top, right, bottom = group_boxes[pid]
+                    xs += [left - GAP_H // 2, right + GAP_H // 2]
+                    ys += [top - GAP_V // 2, bottom + GAP_V // 2]
+        for mx, my in zip(xs, ys):
+            candidates.append([(sx, sy), (sx, my), (tx, my), (tx, ty)])
+            candidates.append([(sx, sy), (mx, sy), (mx, ty), (tx, ty)])
+
+        best = None
+        excluded = {conn["source"], conn["target"]}
+        excluded_groups = ancestors[conn["source"]] | ancestors[conn["target"]]
+        for points in candidates:
+            # Drop zero length segments (aligned icons)
+            points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+            if len(points) < 2:
+                continue
+
+            hits = set()
+            group_hits = set()
+            length = 0
+            for a, b in zip(points, points[1:]):
+                hits |= segment_hits(a, b, grid, cell_w, cell_h, excluded)
+                group_hits |= segment_hits(
+                    a, b, group_grid, group_cell_w, group_cell_h, excluded_groups
+                )
+                length += abs(b[0] - a[0]) + abs(b[1] - a[1])
+
+            score = (len(hits), len(group_hits), length)
+            if best is None or score < best[0]:
+                best = (score, points, hits | group_hits)
+
+        if best is None:
+            continue
+
+        points = list(best[1])
+        points[0] = clip_to_icon(points[0], points[1])
+        points[-1] = clip_to_icon(points[-1], points[-2])
+        crossings = sorted(k[1] if isinstance(k, tuple) else k for k in best[2])
+        result.append(
+            {
+                "source": conn["source"],
+                "target": conn["target"],
+                "points": points,
+                "crossings": crossings,
+            }
+        )
+
+        if crossings and VALIDATE_LAYOUT:
+            blocked += 1
+            print(
+                f"Layout warning: connector {conn['source']} -> {conn['target']} "
+                f"crosses {', '.join(crossings)}"
+            )
+
+    if blocked:
+        print(f"Layout warning: {blocked} of {len(result)} connectors are not clear")
+    return result
+
+
+def open_presentation(template: bytes = None) -> Presentation:
+    """
+    Open FILE_OUTPUT to append slides, or start a new presentation.
+    template: deck content to start from instead of FILE_OUTPUT (b"" for an
+    empty presentation), so repeated runs do not append to their own output
+    """
+    if template is not None:
+        return Presentation(io.BytesIO(template)) if template else Presentation()
     if FILE_OUTPUT.exists():
-        prs = Presentation(pptx=FILE_OUTPUT)
-    else:
-        prs = Presentation()
+        return Presentation(pptx=FILE_OUTPUT)
+    return Presentation()
+
+
+def save_presentation(prs: Presentation, file_path: Path = None) -> bool:
+    """
+    Save file with checking the correct file path (default FILE_OUTPUT).
+    Return True once saved, False if saving failed (the error is printed).
+    Same package as prs.save (pptx.opc.serialized.PackageWriter), but each part
+    is streamed into the zip file on disk as it is serialized: media in
+    PPTX_STORED_EXTS is stored without recompression, XML parts are deflated
+    at PPTX_XML_COMPRESS_LEVEL. The output is replaced only once complete.
+    This relies on python-pptx internals (_ContentTypesItem, _rels) as of the
+    version pinned in requirements.txt; if they are missing, prs.save is used.
+    """
+    if file_path is None:
+        file_path = FILE_OUTPUT
+    tmp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+    try:
+        file_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
+
+        package = prs.part.package
+        if _ContentTypesItem is None or not hasattr(package, "_rels"):
+            prs.save(tmp_path)
+            os.replace(tmp_path, file_path)
+            print(f"Presentation saved to {file_path}")
+            return True
+        parts = tuple(package.iter_parts())
+        with zipfile.ZipFile(
+            tmp_path,
+            "w",
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=PPTX_XML_COMPRESS_LEVEL,
+            strict_timestamps=False,
+        ) as zipf:
+
+            def write(pack_uri, blob: bytes) -> None:
+                if pack_uri.ext.lower() in PPTX_STORED_EXTS:
+                    zipf.writestr(pack_uri.membername, blob, zipfile.ZIP_STORED)
+                else:
+                    zipf.writestr(pack_uri.membername, blob)
+
+            write(
+                CONTENT_TYPES_URI,
+                serialize_part_xml(_ContentTypesItem.xml_for(parts)),
+            )
+            write(PACKAGE_URI.rels_uri, package._rels.xml)
+            for i, part in enumerate(parts, 1):
+                write(part.partname, part.blob)
+                if getattr(part, "_rels", None):
+                    write(part.partname.rels_uri, part.rels.xml)
+                report_progress("save", "parts", i, len(parts))
+
+        os.replace(tmp_path, file_path)
+        print(f"Presentation saved to {file_path}")
+        return True
+    except RenderCancelled:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"Error saving presentation: {e}")
+        return False
+
+
+@lru_cache(maxsize=None)
+def load_icon(icon_path: str, width: int = None, height: int = None) -> bytes:
+    """
+    Return the icon PNG content, computed once per process.
+    - With a display size (EMU), the icon is pre-rendered at ICON_DPI and
+      cached in ICON_CACHE_DIR, keyed on the source content and pixel size
+    - Sources already at or below that size are never upscaled, and the source
+      is kept whenever the rendered file would not be smaller
+    """
+    with open(icon_path, "rb") as f:
+        source = f.read()
+
+    if width is None or height is None or ICON_CACHE_DIR is None:
+        return source
+
+    size_px = (
+        max(1, -(-width * ICON_DPI // 914400)),
+        max(1, -(-height * ICON_DPI // 914400)),
+    )
+    source_hash = hashlib.sha256(source).hexdigest()
+    cache_file = Path(ICON_CACHE_DIR) / f"{source_hash}-{size_px[0]}x{size_px[1]}.png"
+    if cache_file.is_file():
+        with open(cache_file, "rb") as f:
+            return f.read()
+
+    result = source
+    with Image.open(io.BytesIO(source)) as img:
+        if img.width > size_px[0] or img.height > size_px[1]:
+            img = img.convert("RGBA")
+            img.thumbnail(size_px, Image.LANCZOS)  # Keeps the aspect ratio
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG", optimize=True)
+            if buffer.tell() < len(source):
+                result = buffer.getvalue()
+
+    write_atomic(cache_file, result)
+    return result
 
-    slide = prs.slides.add_slide(prs.slide_layouts[PPTX_SLIDE_LAYOUT])
 
-    def add_border_box(category: str, left, top, width, height, text: str = None):
+@lru_cache(maxsize=None)
+def font_metrics() -> dict:
+    """
+    Return the {character: advance width in em} table used to fit labels.
+    - From LABEL_FONT_FILE when set, measured once and cached on disk keyed
+      on the font file content
+    - Else from the built-in LABEL_CHAR_WIDTHS table
+    """
+    if LABEL_FONT_FILE is None:
+        return {c: w for chars, w in LABEL_CHAR_WIDTHS for c in chars}
+
+    with open(LABEL_FONT_FILE, "rb") as f:
+        font_hash = hashlib.sha256(f.read()).hexdigest()
+    cache_file = Path(LABEL_FONT_CACHE_DIR) / f"{font_hash}.json"
+    if cache_file.is_file():
+        with open(cache_file, "r") as f:
+            return json.load(f)
+
+    font = ImageFont.truetype(str(LABEL_FONT_FILE), 1000)
+    chars = [chr(c) for c in range(32, 127)] + ["…"]
+    result = {c: font.getlength(c) / 1000 for c in chars}
+    write_atomic(cache_file, json.dumps(result))
+    return result
+
+
+@lru_cache(maxsize=LABEL_FIT_CACHE_SIZE)
+def fit_label(text: str, width: int, height: int) -> tuple:
+    """
+    Return (font size in pt, paragraphs as tuples of lines) fitting text in a
+    text box of width x height EMU, computed once per (text, box size).
+    - Words wrap at spaces, words longer than a line (ARNs) break anywhere
+    - The size is the largest PPTX_FONT_SIZE - k * LABEL_FONT_STEP at which
+      all lines fit, at LABEL_MIN_FONT_SIZE the lines that do not fit are cut
+      with "…"
+    """
+    widths = font_metrics()
+    avail_w = width - LABEL_INSET_H * 2
+    avail_h = height - LABEL_INSET_V * 2
+
+    def line_width(line: str, size: float) -> float:
+        em = sum(widths.get(c, LABEL_DEFAULT_CHAR_WIDTH) for c in line)
+        return em * size * 12700  # pt -> EMU
+
+    # Widths in em do not depend on the size: measured once per label as
+    # paragraphs of (word, character widths), with the words of a paragraph
+    # at 1 pt in EMU (spaces left out) for the line count lower bound
+    measured = []
+    words_emu = []
+    for paragraph in text.split("\n"):
+        words = [
+            (word, [widths.get(c, LABEL_DEFAULT_CHAR_WIDTH) for c in word])
+            for word in paragraph.split(" ")
+        ]
+        measured.append(words)
+        words_emu.append(sum(sum(char_ems) for _, char_ems in words) * 12700)
+    space_em = widths.get(" ", LABEL_DEFAULT_CHAR_WIDTH)
+
+    def wrap(words: list, size: float) -> list:
+        """
+        Greedy wrap of a measured paragraph, linear in its length. Line widths
+        add up character by character and compare like line_width: widths are
+        multiples of 0.001 em and lines that fit exactly are common.
+        """
+        lines = []
+        line = ""
+        line_em = 0
+        for word, char_ems in words:
+            candidate_em = line_em + space_em if line else 0
+            for c_em in char_ems:
+                candidate_em += c_em
+            if candidate_em * size * 12700 <= avail_w:
+                line = f"{line} {word}" if line else word
+                line_em = candidate_em
+                continue
+            if line:
+                lines.append(line)
+            line = ""
+            line_em = 0
+            for c, c_em in zip(word, char_ems):  # Break a too long word anywhere
+                if line and (line_em + c_em) * size * 12700 > avail_w:
+                    lines.append(line)
+                    line = ""
+                    line_em = 0
+                line += c
+                line_em += c_em
+        lines.append(line)
+        return lines
+
+    max_size = PPTX_FONT_SIZE.pt
+    last_step = max(0, int((max_size - LABEL_MIN_FONT_SIZE.pt) // LABEL_FONT_STEP))
+
+    def fit(step: int) -> tuple:
+        """(size, paragraphs, line count, line height) at a size step"""
+        size = max_size - step * LABEL_FONT_STEP
+        paragraphs = [wrap(words, size) for words in measured]
+        line_h = size * LABEL_LINE_SPACING * 12700
+        return size, paragraphs, sum(len(p) for p in paragraphs), line_h
+
+    def min_lines(step: int) -> int:
+        """
+        Lower bound of the line count at a size step, without wrapping: a
+        paragraph needs at least (its words * size / line width) lines
+        """
+        size = max_size - step * LABEL_FONT_STEP
+        return sum(max(1, math.ceil(w * size / avail_w - 1e-9)) for w in words_emu)
+
+    def step_for(n_lines: int) -> int:
+        """First size step at which n_lines lines fit the height (or below)"""
+        size = avail_h / (n_lines * LABEL_LINE_SPACING * 12700)
+        step = math.ceil((max_size - size) / LABEL_FONT_STEP - 1e-9)
+        return min(max(0, step), last_step)
+
+    def line_height(step: int) -> float:
+        return (max_size - step * LABEL_FONT_STEP) * LABEL_LINE_SPACING * 12700
+
+    # No size fits fewer lines than the lower bound at the minimum size: the
+    # size starts from the step computed from that line count, skips the steps
+    # whose own lower bound does not fit and usually wraps only once
+    step = step_for(min_lines(last_step))
+    while True:
+        while step < last_step and min_lines(step) * line_height(step) > avail_h:
+            step += 1
+        size, paragraphs, n_lines, line_h = fit(step)
+        if n_lines * line_h <= avail_h or step >= last_step:
+            break
+        step += 1
+
+    # Still too long at the minimum size, keep the lines that fit
+    max_lines = max(1, int(avail_h // line_h))
+    if n_lines > max_lines:
+        kept = []
+        for lines in paragraphs:
+            room = max_lines - sum(len(p) for p in kept)
+            if room <= 0:
+                break
+            kept.append(lines[:room])
+        last = kept[-1][-1]
+        while last and line_width(last + "…", size) > avail_w:
+            last = last[:-1]
+        kept[-1][-1] = last + "…"
+        paragraphs = kept
+
+    return size, tuple(tuple(lines) for lines in paragraphs)
+
+
+def set_label_text(text_frame, text: str, width: int, height: int) -> None:
+    """Write a fitted label: fixed font size and explicit line breaks"""
+    size, paragraphs = fit_label(text, int(width), int(height))
+    text_frame.text = "\n".join("\v".join(lines) for lines in paragraphs)
+    text_frame.word_wrap = True
+    text_frame.auto_size = MSO_AUTO_SIZE.NONE
+
+    for paragraph in text_frame.paragraphs:
+        paragraph.font.size = Pt(size)
+        for run in paragraph.runs:  # Runs do not inherit the paragraph default
+            run.font.size = Pt(size)
+
+
+def add_slide_shapes(slide, data: list, connections: list = None) -> dict:
+    """
+    Add Powerpoint shapes for positioned data to a slide.
+    Return the border shape of every group by id (e.g. for hyperlinks).
+    """
+    group_shapes = {}
+
+    def add_border_box(
+        category: str, left, top, width, height, text: str = None, diff: str = None
+    ):
         """
         Add a bordered box of given type at given position.
         """
 
         def get_color(type: str = category) -> RGBColor:
-            """Return RGBColor based on category type"""
+            """Return RGBColor based on category type (or snapshot diff status)"""
+            if diff in DIFF_COLOR_MAP:
+                return DIFF_COLOR_MAP[diff]
             return BORDER_COLOR_MAP.get(type.lower(), BORDER_COLOR_MAP["default"])
 
         def get_icon(type: str = category) -> str:
@@ -1222,7 +3230,11 @@ def generate_pptx(data: list) -> None:
             grp_icon_left = left
             grp_icon_top = top
             slide.shapes.add_picture(
-                grp_icon, grp_icon_left, grp_icon_top, GROUP_ICON_W, GROUP_ICON_H
+                io.BytesIO(load_icon(grp_icon, GROUP_ICON_W, GROUP_ICON_H)),
+                grp_icon_left,
+                grp_icon_top,
+                GROUP_ICON_W,
+                GROUP_ICON_H,
             )
 
         if text is not None:
@@ -1230,13 +3242,11 @@ def generate_pptx(data: list) -> None:
                 grp_label_left, grp_label_top, GROUP_LABEL_TB_W, GROUP_LABEL_TB_H
             )
 
-            label_frame = grp_label.text_frame
-            label_frame.text = text
-            label_frame.word_wrap = True
-            label_frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+            set_label_text(
+                grp_label.text_frame, text, GROUP_LABEL_TB_W, GROUP_LABEL_TB_H
+            )
 
-            for paragraph in label_frame.paragraphs:
-                paragraph.font.size = PPTX_FONT_SIZE
+        return grp_shape
 
     def add_item_box(category: str, left, top, text: str):
         """Add image + text inside a framed box at given position"""
@@ -1250,12 +3260,16 @@ def generate_pptx(data: list) -> None:
                 raise ValueError(f"Icon type: {type} is not found")
 
         # Image Position
-        img_left = left + (ITEM_W / 2 - ITEM_ICON_W / 2)
+        img_left = left + (ITEM_W // 2 - ITEM_ICON_W // 2)
         img_top = top
         img_path = get_icon()
 
         slide.shapes.add_picture(
-            img_path, left=img_left, top=img_top, width=ITEM_ICON_W, height=ITEM_ICON_H
+            io.BytesIO(load_icon(img_path, ITEM_ICON_W, ITEM_ICON_H)),
+            left=img_left,
+            top=img_top,
+            width=ITEM_ICON_W,
+            height=ITEM_ICON_H,
         )
 
         if text is None:
@@ -1269,28 +3283,33 @@ def generate_pptx(data: list) -> None:
             left=tb_left, top=tb_top, width=ITEM_DESC_TB_W, height=ITEM_DESC_TB_H
         )
         frame = textbox.text_frame
-        frame.text = text
-        frame.word_wrap = True
-        frame.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+        set_label_text(frame, text, ITEM_DESC_TB_W, ITEM_DESC_TB_H)
         frame.vertical_anchor = MSO_ANCHOR.MIDDLE
 
         for paragraph in frame.paragraphs:
-            paragraph.font.size = PPTX_FONT_SIZE
             paragraph.alignment = PP_ALIGN.CENTER
 
-    def save_file() -> None:
-        """Save file with checking the correct file path"""
-        file_path = FILE_OUTPUT
-        try:
-            file_path.parent.mkdir(
-                parents=True, exist_ok=True
-            )  # Ensure directory exists
-            prs.save(file_path)
-            print(f"Presentation saved to {file_path}")
-        except Exception as e:
-            print(f"Error saving presentation: {e}")
-
-    for node in data:
+    def add_diff_frame(node: dict) -> None:
+        """Frame an item with its snapshot diff status color"""
+        left, top, right, bottom = node_box(node)
+        frame = slide.shapes.add_shape(
+            MSO_SHAPE.RECTANGLE, left, top, right - left, bottom - top
+        )
+        frame.fill.background()
+        frame.line.width = Pt(1.25)
+        frame.line.color.rgb = DIFF_COLOR_MAP[node["diff"]]
+
+    def add_connector(points: list) -> None:
+        """Add an orthogonal polyline (single freeform shape) through points"""
+        builder = slide.shapes.build_freeform(*points[0], scale=1.0)
+        builder.add_line_segments(points[1:], close=False)
+        line_shape = builder.convert_to_shape()
+        line_shape.fill.background()
+        line_shape.line.width = CONNECTOR_LINE_W
+        line_shape.line.color.rgb = CONNECTOR_COLOR
+
+    for i, node in enumerate(data, 1):
+        report_progress("render", "nodes", i, len(data))
         node_id = node["id"]
         node_type = node["type"]
         node_cate = node["category"]
@@ -1304,7 +3323,15 @@ def generate_pptx(data: list) -> None:
             style_w = node["style"]["width"]
             style_h = node["style"]["height"]
 
-            add_border_box(node_cate, pos_left, pos_top, style_w, style_h, node_id)
+            group_shapes[node_id] = add_border_box(
+                node_cate,
+                pos_left,
+                pos_top,
+                style_w,
+                style_h,
+                node.get("data", {}).get("name", node_id),
+                node.get("diff"),
+            )
         else:  # node_type == "item"
             node_data = node.get("data", {})
 
@@ -1313,25 +3340,787 @@ def generate_pptx(data: list) -> None:
             #     data_name = node_id
 
             add_item_box(node_cate, pos_left, pos_top, data_name)
-    save_file()
 
+            if node.get("diff") in DIFF_COLOR_MAP:
+                add_diff_frame(node)
+
+    for route in route_connections(data, connections or []):
+        add_connector(route["points"])
+
+    return group_shapes
+
+
+def generate_pptx(data: list, connections: list = None, template: bytes = None) -> None:
+    """
+    Generate Powerpoint shapes from data then save
+    template: see open_presentation
+    """
+    prs = open_presentation(template)
+    slide = prs.slides.add_slide(prs.slide_layouts[PPTX_SLIDE_LAYOUT])
+    add_slide_shapes(slide, data, connections)
+    save_presentation(prs)
+
+
+def generate_overview_pptx(
+    data: list,
+    connections: list = None,
+    detail_vpcs: list = None,
+    layout_memo: dict = None,
+    template: bytes = None,
+) -> None:
+    """
+    Generate a summary slide of regions and VPCs (resource counts only) and one
+    detail slide per requested VPC, then save.
+    - Counts come from cal_group_counts, the summary needs no layout pass
+    - Only the requested VPCs (None for all) are laid out and rendered
+    - VPC boxes link to their detail slide, detail regions link back
+    - layout_memo: in process layout cache (see cal_region_position_mapping)
+    - template: see open_presentation
+    """
+
+    def get_summary(counts: dict) -> str:
+        return "  ".join(f"{cate}: {count}" for cate, count in sorted(counts.items()))
+
+    def get_detail_nodes(vpc_id: str) -> list:
+        """Return a copy of the VPC subtree, its ancestors and the AZs it uses"""
+        included = {vpc_id} | ancestors[vpc_id]
+        for n in data:
+            if vpc_id in ancestors[n["id"]]:
+                included.add(n["id"])
+                included.update(n.get("parentId", []))
+        return [copy.deepcopy(n) for n in data if n["id"] in included]
+
+    counts = cal_group_counts(data)
+    ancestors = build_ancestor_index(data)
+    regions = [n for n in data if n["category"] == "region"]
+    vpcs = defaultdict(list)
+    for n in data:
+        if n["category"] == "vpc":
+            for pid in n.get("parentId", []):
+                vpcs[pid].append(n)
+
+    # Summary layout, VPC boxes flow in rows inside their region
+    columns = max(1, int((SLIDE_W - PAD_H * 2 + GAP_H) // (OVERVIEW_BOX_W + GAP_H)))
+    summary_nodes = []
+    current_top = START_TOP
+    for region in regions:
+        region_vpcs = vpcs[region["id"]]
+        rows = -(-len(region_vpcs) // columns)
+        region_total = sum(counts[region["id"]].values())
+        label = region.get("data", {}).get("name", region["id"])
+        region_h = PAD_V * 2 + GROUP_LABEL_TB_H
+        if rows:
+            region_h = PAD_V * 2 + rows * OVERVIEW_BOX_H + (rows - 1) * GAP_V
+
+        summary_nodes.append(
+            {
+                "id": region["id"],
+                "type": "group",
+                "category": "region",
+                "data": {"name": f"{label} ({region_total})"},
+                "position": {"left": START_LEFT, "top": current_top},
+                "style": {"width": SLIDE_W, "height": region_h},
+            }
+        )
+        for i, vpc in enumerate(region_vpcs):
+            row, col = divmod(i, columns)
+            summary_nodes.append(
+                {
+                    "id": vpc["id"],
+                    "type": "group",
+                    "category": "vpc",
+                    "position": {
+                        "left": START_LEFT + PAD_H + col * (OVERVIEW_BOX_W + GAP_H),
+                        "top": current_top + PAD_V + row * (OVERVIEW_BOX_H + GAP_V),
+                    },
+                    "style": {"width": OVERVIEW_BOX_W, "height": OVERVIEW_BOX_H},
+                }
+            )
+        current_top += region_h + GAP_V
+
+    prs = open_presentation(template)
+    layout = prs.slide_layouts[PPTX_SLIDE_LAYOUT]
+    overview_slide = prs.slides.add_slide(layout)
+    summary_shapes = add_slide_shapes(overview_slide, summary_nodes)
+
+    for n in summary_nodes:
+        if n["category"] != "vpc":
+            continue
+        summary = overview_slide.shapes.add_textbox(
+            n["position"]["left"] + PAD_H,
+            n["position"]["top"] + GROUP_ICON_H + GROUP_GAP_ICON_LABEL,
+            OVERVIEW_BOX_W - PAD_H * 2,
+            OVERVIEW_BOX_H - GROUP_ICON_H - GROUP_GAP_ICON_LABEL,
+        )
+        frame = summary.text_frame
+        frame.text = get_summary(counts[n["id"]]) or "empty"
+        frame.word_wrap = True
+        for paragraph in frame.paragraphs:
+            paragraph.font.size = PPTX_FONT_SIZE
+
+    # Detail slides, built only for the requested VPCs
+    for region in regions:
+        for vpc in vpcs[region["id"]]:
+            if detail_vpcs is not None and vpc["id"] not in detail_vpcs:
+                continue
+
+            positioned = cal_region_position_mapping(
+                get_detail_nodes(vpc["id"]), memory_cache=layout_memo
+            )
+            detail_slide = prs.slides.add_slide(layout)
+            detail_shapes = add_slide_shapes(detail_slide, positioned, connections)
+
+            summary_shapes[vpc["id"]].click_action.target_slide = detail_slide
+            for gid in ancestors[vpc["id"]]:
+                if gid in detail_shapes:
+                    detail_shapes[gid].click_action.target_slide = overview_slide
+
+    save_presentation(prs)
+
+
+def render_settings() -> list:
+    """Return the settings the rendered shapes depend on (shard cache key)"""
+    return [
+        PPTX_SLIDE_LAYOUT,
+        PPTX_FONT_SIZE,
+        LABEL_FONT_FILE,
+        LABEL_MIN_FONT_SIZE,
+        LABEL_FONT_STEP,
+        LABEL_LINE_SPACING,
+        LABEL_INSET_H,
+        LABEL_INSET_V,
+        LABEL_CHAR_WIDTHS,
+        LABEL_DEFAULT_CHAR_WIDTH,
+        ICON_DPI,
+        GROUP_ICON_W,
+        GROUP_ICON_H,
+        GROUP_LABEL_TB_W,
+        GROUP_LABEL_TB_H,
+        GROUP_GAP_ICON_LABEL,
+        ITEM_ICON_W,
+        ITEM_ICON_H,
+        ITEM_DESC_TB_W,
+        ITEM_DESC_TB_H,
+        ITEM_GAP_ICON_DESC,
+        ITEM_ICON_MAP,
+        BORDER_COLOR_MAP,
+        BORDER_ICON_MAP,
+        BORDER_DASH_MAP,
+        DIFF_COLOR_MAP,
+        CONNECTOR_COLOR,
+        CONNECTOR_LINE_W,
+    ]
+
+
+def render_shard(shard_nodes: list, connections: list, file_path: Path) -> dict:
+    """
+    Shard worker: lay out and save one shard deck, skipped when the shard
+    content (with diff status), layout and render settings did not change
+    since the deck was written.
+    Shard decks start from an empty presentation, not from FILE_OUTPUT like
+    the index deck: FILE_OUTPUT holds the previous index slides.
+    Return {group id: total span} of the laid out groups (for the index deck).
+    """
+    shard_keys = ("id", "type", "category", "data", "parentId", "sharedGroup", "diff")
+    shard_input = [{k: n[k] for k in shard_keys if k in n} for n in shard_nodes]
+    buffer = json.dumps(
+        [
+            layout_settings(),
+            render_settings(),
+            str(file_path),
+            shard_input,
+            connections,
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    shard_key = hashlib.sha256(buffer.encode("utf-8")).hexdigest()
+    path_key = hashlib.sha256(str(file_path.resolve()).encode("utf-8")).hexdigest()
+    key_file = SHARD_CACHE_DIR / f"{path_key}.json"
+
+    if file_path.exists() and key_file.is_file():
+        with open(key_file, "r") as f:
+            cached = json.load(f)
+        if cached["key"] == shard_key:
+            print(f"Presentation unchanged: {file_path}")
+            return cached["spans"]
+
+    positioned = cal_region_position_mapping(shard_nodes)
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[PPTX_SLIDE_LAYOUT])
+    add_slide_shapes(slide, positioned, connections)
+    saved = save_presentation(prs, file_path)
+
+    spans = {
+        n["id"]: sum(sum(v) for v in n["span"].values())
+        for n in positioned
+        if n["type"] == "group" and "span" in n
+    }
+    if saved:  # A failed save must not mark the previous deck as up to date
+        write_atomic(key_file, json.dumps({"key": shard_key, "spans": spans}))
+    return spans
+
+
+def generate_sharded_pptx(
+    data: list,
+    connections: list = None,
+    shard_by: str = "region",
+    template: bytes = None,
+) -> None:
+    """
+    Write one deck per region (or account) in parallel workers, and an index
+    deck at FILE_OUTPUT linking to each shard.
+    - A shard holds its region / account subtree and the ancestors of it
+    - Shard decks are named <FILE_OUTPUT stem>_<region or account>.pptx
+    - Index counts are the cal_grouping spans (item units) of each shard and
+      of its VPCs, returned by the shard workers
+    - template: base of the index deck, see open_presentation
+    """
+    connections = connections or []
+    ancestors = build_ancestor_index(data)
+    shard_roots = [n for n in data if n["category"] == shard_by]
+    if not shard_roots:
+        exit(f"No {shard_by} group to shard by")
+
+    def shard_path(root: dict) -> Path:
+        label = root.get("data", {}).get("name", root["id"])
+        if shard_by == "region" and root.get("parentId"):
+            label = root["id"]  # Account scoped region id
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        return FILE_OUTPUT.with_name(f"{FILE_OUTPUT.stem}_{safe}{FILE_OUTPUT.suffix}")
+
+    shards = []
+    covered = set()
+    for root in shard_roots:
+        included = {root["id"]} | ancestors[root["id"]]
+        for n in data:
+            if root["id"] in ancestors[n["id"]]:
+                included.add(n["id"])
+                included.update(n.get("parentId", []))
+        shard_nodes = [n for n in data if n["id"] in included]
+        shard_connections = [
+            c
+            for c in connections
+            if c["source"] in included and c["target"] in included
+        ]
+        shards.append((root, shard_nodes, shard_connections, shard_path(root)))
+        covered |= included
+
+    outside = sum(1 for n in data if n["type"] == "item" and n["id"] not in covered)
+    if outside:
+        print(f"{outside} items outside any {shard_by} are left out of the shards")
+
+    with ProcessPoolExecutor(
+        max_workers=min(INPUT_WORKERS, len(shards)), initializer=set_progress
+    ) as ex:
+        futures = [
+            ex.submit(render_shard, nodes, conns, path)
+            for _, nodes, conns, path in shards
+        ]
+        spans = []
+        try:
+            for f in futures:
+                spans.append(f.result())
+                report_progress("render", "shards", len(spans), len(futures))
+        except RenderCancelled:
+            for f in futures:
+                f.cancel()
+            raise
+
+    # Index deck, one box per shard listing its VPCs
+    vpcs = defaultdict(list)
+    for n in data:
+        if n["category"] == "vpc":
+            for pid in n.get("parentId", []):
+                vpcs[pid].append(n["id"])
+
+    columns = max(1, int((SLIDE_W + GAP_H) // (OVERVIEW_BOX_W + GAP_H)))
+    index_nodes = []
+    lines = {}
+    for i, (root, _, _, path) in enumerate(shards):
+        row, col = divmod(i, columns)
+        label = root.get("data", {}).get("name", root["id"])
+        shard_spans = spans[i]
+        index_nodes.append(
+            {
+                "id": root["id"],
+                "type": "group",
+                "category": shard_by,
+                "data": {"name": f"{label} ({shard_spans.get(root['id'], 0)})"},
+                "position": {
+                    "left": START_LEFT + col * (OVERVIEW_BOX_W + GAP_H),
+                    "top": START_TOP + row * (OVERVIEW_BOX_H + GAP_V),
+                },
+                "style": {"width": OVERVIEW_BOX_W, "height": OVERVIEW_BOX_H},
+            }
+        )
+        region_ids = [root["id"]]
+        if shard_by == "account":
+            region_ids = [n["id"] for n in data if root["id"] in n.get("parentId", [])]
+        lines[root["id"]] = [
+            f"{vpc_id}: {shard_spans.get(vpc_id, 0)}"
+            for rid in region_ids
+            for vpc_id in vpcs[rid]
+        ]
+
+    prs = open_presentation(template)
+    slide = prs.slides.add_slide(prs.slide_layouts[PPTX_SLIDE_LAYOUT])
+    index_shapes = add_slide_shapes(slide, index_nodes)
+
+    for n, (_, _, _, path) in zip(index_nodes, shards):
+        index_shapes[n["id"]].click_action.hyperlink.address = path.name
+
+        summary = slide.shapes.add_textbox(
+            n["position"]["left"] + PAD_H,
+            n["position"]["top"] + GROUP_ICON_H + GROUP_GAP_ICON_LABEL,
+            OVERVIEW_BOX_W - PAD_H * 2,
+            OVERVIEW_BOX_H - GROUP_ICON_H - GROUP_GAP_ICON_LABEL,
+        )
+        frame = summary.text_frame
+        frame.text = "\n".join(lines[n["id"]]) or "no VPC"
+        frame.word_wrap = True
+        for paragraph in frame.paragraphs:
+            paragraph.font.size = PPTX_FONT_SIZE
+
+    save_presentation(prs)
+
+
+def extract_unit(unit) -> tuple:
+    """
+    Pipeline worker, first stage: extract and map one unit, an input file path
+    or one region entry of the collector JSON. Return (items, connections).
+    """
+    data = load_data(unit) if isinstance(unit, (str, Path)) else [unit]
+    resources = extract_resources(data)
+    return generate_group_items_mapping(resources), extract_connections(data)
 
-def main() -> None:
-    input_file = FILE_INPUT
 
-    json_data = load_data(input_file)
-    # print_json(json_data)
+def layout_unit(items: list) -> list:
+    """
+    Pipeline worker, second stage: lay out the mapped items of one unit.
+    Return the positioned nodes.
+    """
+    return cal_region_position_mapping(items)
+
+
+def generate_pipelined_pptx(file_input, template: bytes = None) -> None:
+    """
+    Generate the diagram slide with overlapping stages, then save.
+    - Units are the files of a directory, or the regions of a single file
+    - Three stages: worker processes extract and map units (extract_unit),
+      then lay them out (layout_unit), while the main process renders the
+      laid out ones in input order; each stage holds up to PIPELINE_DEPTH units
+    - Units are independent: each is placed right of the previous one, in
+      input order, and resources repeated across units are not merged
+    - template: see open_presentation
+    """
+    if Path(file_input).is_dir():
+        units = sorted(p for p in Path(file_input).iterdir() if p.suffix == ".json")
+    else:
+        units = load_data(file_input)  # Only the parse of a single file is upfront
+
+    prs = open_presentation(template)
+    slide = prs.slides.add_slide(prs.slide_layouts[PPTX_SLIDE_LAYOUT])
+    current_left = START_LEFT
+
+    def render(positioned: list, connections: list) -> None:
+        nonlocal current_left
+        if not positioned:
+            return
 
-    flat_data = extract_resources(json_data)
+        dx = current_left - START_LEFT
+        for n in positioned:
+            n["position"]["left"] += dx
+        current_left = GAP_H + max(
+            n["position"]["left"] + n["style"]["width"] for n in positioned
+        )
+
+        if VALIDATE_LAYOUT:
+            for issue in validate_layout(positioned):
+                print(f"Layout warning: {issue['message']}")
+        add_slide_shapes(slide, positioned, connections)
+
+    with ProcessPoolExecutor(
+        max_workers=INPUT_WORKERS, initializer=set_progress
+    ) as executor:
+        extracting = deque()
+        laying_out = deque()  # (future of positioned nodes, connections)
+        rendered = 0
+
+        def layout_next() -> None:
+            items, connections = extracting.popleft().result()
+            laying_out.append((executor.submit(layout_unit, items), connections))
+
+        def render_next() -> None:
+            nonlocal rendered
+            positioned, connections = laying_out.popleft()
+            render(positioned.result(), connections)
+            rendered += 1
+            report_progress("render", "units", rendered, len(units))
+
+        try:
+            for unit in units:
+                extracting.append(executor.submit(extract_unit, unit))
+                if len(extracting) >= PIPELINE_DEPTH:
+                    layout_next()
+                if len(laying_out) >= PIPELINE_DEPTH:
+                    render_next()
+            while extracting:
+                layout_next()
+                if len(laying_out) >= PIPELINE_DEPTH:
+                    render_next()
+            while laying_out:
+                render_next()
+        except RenderCancelled:
+            for f in extracting:
+                f.cancel()
+            for f, _ in laying_out:
+                f.cancel()
+            raise
+
+    save_presentation(prs)
+
+
+def generate_preview(
+    data: list, output_format: str = "svg", connections: list = None
+) -> None:
+    """
+    Render positioned data into a single SVG (or self-contained HTML) file.
+    - Shares styling with generate_pptx (BORDER_*_MAP, ITEM_ICON_MAP)
+    - Each icon is embedded once as a <symbol> and referenced with <use>
+    - Shapes are written to the file as they are visited, nothing is buffered
+    """
+    file_path = FILE_OUTPUT.with_suffix(f".{output_format}")
+
+    def px(emu) -> str:
+        """Convert EMU to a compact px string"""
+        return f"{emu / PREVIEW_EMU_PER_PX:.2f}".rstrip("0").rstrip(".")
+
+    def icon_ref(path: str) -> str:
+        """Return the <defs> id of an icon path, computed once per icon"""
+        ref = icon_refs.get(path)
+        if ref is None:
+            ref = icon_refs[path] = "icon-" + Path(path).stem
+        return ref
+
+    def get_item_icon(type: str) -> str:
+        """Return item icon"""
+        result = ITEM_ICON_MAP.get(type.lower(), None)
+        if result:
+            return result
+        else:
+            raise ValueError(f"Icon type: {type} is not found")
+
+    def write_text(
+        f, left, top, width, height, text: str, anchor: str = "start"
+    ) -> None:
+        """
+        Write a label fitted like in the slides (fit_label), one <tspan> per
+        line. Centered text (anchor "middle") is also centered vertically.
+        """
+        size, paragraphs = fit_label(text, int(width), int(height))
+        lines = [line for p in paragraphs for line in p]
+        x = left + width // 2 if anchor == "middle" else left + LABEL_INSET_H
+        y = top + LABEL_INSET_V
+        if anchor == "middle":
+            text_h = len(lines) * size * LABEL_LINE_SPACING * 12700
+            y = top + max(0, (height - text_h) / 2)
+
+        f.write(
+            f'<text x="{px(x)}" y="{px(y)}" font-size="{size}pt" '
+            f'text-anchor="{anchor}">'
+        )
+        for i, line in enumerate(lines):
+            dy = "1em" if i == 0 else f"{LABEL_LINE_SPACING}em"
+            f.write(f'<tspan x="{px(x)}" dy="{dy}">{escape(line)}</tspan>')
+        f.write("</text>\n")
+
+    def add_border_box(f, category: str, left, top, width, height, text: str = None):
+        """Write a bordered box of given type at given position."""
+        cate = category.lower()
+        color = BORDER_COLOR_MAP.get(cate, BORDER_COLOR_MAP["default"])
+        dash = BORDER_DASH_MAP.get(cate, BORDER_DASH_MAP["default"])
+        dash_array = PREVIEW_DASH_MAP.get(dash)
+        grp_icon = BORDER_ICON_MAP.get(cate, BORDER_ICON_MAP["default"])
+
+        f.write(
+            f'<rect x="{px(left)}" y="{px(top)}" width="{px(width)}" '
+            f'height="{px(height)}" fill="none" stroke="#{color}"'
+            + (f' stroke-dasharray="{dash_array}"' if dash_array else "")
+            + "/>\n"
+        )
+
+        grp_label_left = left
+        if grp_icon is not None:
+            grp_label_left += GROUP_ICON_W + GROUP_GAP_ICON_LABEL
+            f.write(
+                f'<use href="#{icon_ref(grp_icon)}" x="{px(left)}" y="{px(top)}" '
+                f'width="{px(GROUP_ICON_W)}" height="{px(GROUP_ICON_H)}"/>\n'
+            )
+
+        if text is not None:
+            write_text(f, grp_label_left, top, GROUP_LABEL_TB_W, GROUP_LABEL_TB_H, text)
+
+    def add_item_box(f, category: str, left, top, text: str):
+        """Write image + text at given position"""
+        img_left = left + (ITEM_W // 2 - ITEM_ICON_W // 2)
+        f.write(
+            f'<use href="#{icon_ref(get_item_icon(category))}" x="{px(img_left)}" '
+            f'y="{px(top)}" width="{px(ITEM_ICON_W)}" height="{px(ITEM_ICON_H)}"/>\n'
+        )
+
+        if text is None:
+            return
+
+        tb_top = top + ITEM_ICON_H + ITEM_GAP_ICON_DESC
+        write_text(
+            f, left, tb_top, ITEM_DESC_TB_W, ITEM_DESC_TB_H, text, anchor="middle"
+        )
+
+    # Single pass for canvas size and the icons actually used
+    canvas_w = canvas_h = 0
+    icon_refs = {}
+    icons = {}
+    for node in data:
+        canvas_w = max(canvas_w, node["position"]["left"] + node["style"]["width"])
+        canvas_h = max(canvas_h, node["position"]["top"] + node["style"]["height"])
+        if node["type"] == "group":
+            icon = BORDER_ICON_MAP.get(
+                node["category"].lower(), BORDER_ICON_MAP["default"]
+            )
+        else:
+            icon = get_item_icon(node["category"])
+        if icon is not None:
+            icons[icon_ref(icon)] = icon
+    canvas_w += START_LEFT
+    canvas_h += START_TOP
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
+    with open(file_path, "w", encoding="utf-8") as f:
+        if output_format == "html":
+            f.write(
+                '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                f"<title>{escape(file_path.stem)}</title></head><body>\n"
+            )
+        f.write(
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{px(canvas_w)}" '
+            f'height="{px(canvas_h)}" viewBox="0 0 {px(canvas_w)} {px(canvas_h)}" '
+            f'font-family="sans-serif" font-size="{PPTX_FONT_SIZE.pt}pt" '
+            f'stroke-width="{PREVIEW_LINE_W:.2f}">\n<defs>\n'
+        )
+        for ref, icon in icons.items():
+            encoded = base64.b64encode(load_icon(icon)).decode("ascii")
+            f.write(
+                f'<symbol id="{ref}" viewBox="0 0 1 1"><image width="1" height="1" '
+                f'href="data:image/png;base64,{encoded}"/></symbol>\n'
+            )
+        f.write("</defs>\n")
+
+        for node in data:
+            node_type = node["type"]
+            node_cate = node["category"]
+            pos_left = node["position"]["left"]
+            pos_top = node["position"]["top"]
+
+            if node_type == "group":
+                style_w = node["style"]["width"]
+                style_h = node["style"]["height"]
+                label = node.get("data", {}).get("name", node["id"])
+                add_border_box(f, node_cate, pos_left, pos_top, style_w, style_h, label)
+            else:  # node_type == "item"
+                data_name = node.get("data", {}).get("name", None)
+                add_item_box(f, node_cate, pos_left, pos_top, data_name)
+
+        for route in route_connections(data, connections or []):
+            points = " ".join(f"{px(x)},{px(y)}" for x, y in route["points"])
+            f.write(
+                f'<polyline points="{points}" fill="none" '
+                f'stroke="#{CONNECTOR_COLOR}" stroke-width="{CONNECTOR_LINE_W.pt}pt"/>\n'
+            )
+
+        f.write("</svg>\n")
+        if output_format == "html":
+            f.write("</body></html>\n")
+
+    print(f"Preview saved to {file_path}")
+
+
+def project(
+    input_file,
+    extract_memo: dict = None,
+    layout_memo: dict = None,
+    template: bytes = None,
+) -> None:
+    """
+    Run one projection of input_file into FILE_OUTPUT.
+    extract_memo / layout_memo: in process caches kept between runs (watch mode)
+    template: deck to add the slides to instead of FILE_OUTPUT (watch mode)
+    """
+    if PIPELINE:
+        if (
+            OUTPUT_FORMAT == "pptx"
+            and OUTPUT_DETAIL == "full"
+            and not OUTPUT_SHARD
+            and not SHAPE_BUDGET
+            and not FILE_INPUT_PREVIOUS
+            and not COLLECT_REGIONS
+            and Path(input_file).suffix != ".jsonl"
+        ):
+            generate_pipelined_pptx(input_file, template)
+            return
+        print(
+            "PIPELINE only applies to a full unsharded pptx deck from JSON input without SHAPE_BUDGET, running sequentially"
+        )
+
+    if COLLECT_REGIONS:
+        flat_data, connections = collect_inputs(COLLECT_REGIONS)
+    elif Path(input_file).suffix == ".jsonl" and not FILE_INPUT_PREVIOUS:
+        # Stream flattened records straight into the mapping
+        flat_data, connections = load_resource_lines(input_file), []
+    else:
+        flat_data, connections = merge_inputs(input_file, extract_memo)
     # print_json(flat_data)
+    # print_json(connections)
+
+    # With OUTPUT_SHARD the budget applies to each shard deck
+    budget_shard = OUTPUT_SHARD if OUTPUT_FORMAT == "pptx" else None
+    detail_levels = {}
+    if SHAPE_BUDGET:
+        flat_data, connections, detail_levels = fit_shape_budget(
+            list(flat_data), connections, SHAPE_BUDGET, budget_shard
+        )
 
-    grouped_items = generate_group_items_mapping(flat_data)
+    if FILE_INPUT_PREVIOUS:
+        previous_flat_data, _ = merge_inputs(FILE_INPUT_PREVIOUS, extract_memo)
+        previous_shards = defaultdict(list)
+        for item in previous_flat_data:
+            previous_shards[shard_key(item, budget_shard)].append(item)
+        # A shard only in the previous snapshot takes the lowest detail used
+        lowest = max(detail_levels.values(), default=0)
+        previous_flat_data = []
+        for key, shard_items in previous_shards.items():
+            level = detail_levels.get(key, lowest)
+            previous_flat_data.extend(reduce_detail(shard_items, [], level)[0])
+        grouped_items = diff_snapshots(previous_flat_data, flat_data)
+    else:
+        grouped_items = generate_group_items_mapping(flat_data)
     # print_json(grouped_items)
 
-    positioned_items = cal_position_mapping(grouped_items)
+    if OUTPUT_FORMAT == "pptx" and OUTPUT_SHARD:
+        generate_sharded_pptx(grouped_items, connections, OUTPUT_SHARD, template)
+        return
+
+    if OUTPUT_FORMAT == "pptx" and OUTPUT_DETAIL == "overview":
+        generate_overview_pptx(
+            grouped_items, connections, DETAIL_VPCS, layout_memo, template
+        )
+        return
+
+    positioned_items = cal_region_position_mapping(
+        grouped_items, memory_cache=layout_memo
+    )
     # print_json(positioned_items)
 
-    generate_pptx(positioned_items)
+    if VALIDATE_LAYOUT:
+        for issue in validate_layout(positioned_items):
+            print(f"Layout warning: {issue['message']}")
+
+    if OUTPUT_FORMAT == "pptx":
+        generate_pptx(positioned_items, connections, template)
+    else:
+        generate_preview(positioned_items, OUTPUT_FORMAT, connections)
+
+
+def watch_input(input_file) -> None:
+    """
+    Regenerate the output whenever input_file (file or directory) changes.
+    - Files are polled every WATCH_POLL_INTERVAL, a burst of writes is
+      debounced until nothing changed for WATCH_DEBOUNCE
+    - The process stays warm: unchanged files are not extracted again,
+      unchanged regions reuse their layout, icons are read once
+    - The deck is rebuilt on each run from FILE_OUTPUT as it was when watching
+      started, so it does not gain a slide per regeneration
+    - A failed run (e.g. a half-written input) is reported, watching goes on
+    """
+
+    def scan() -> dict:
+        """Return {path: (size, mtime)} of the watched input files"""
+        input_path = Path(input_file)
+        if input_path.is_dir():
+            paths = [p for p in input_path.iterdir() if p.suffix in (".json", ".jsonl")]
+        else:
+            paths = [input_path]
+
+        result = {}
+        for p in paths:
+            try:
+                stat = p.stat()
+            except OSError:
+                continue
+            result[p] = (stat.st_size, stat.st_mtime_ns)
+        return result
+
+    def regenerate() -> None:
+        start = time.monotonic()
+        try:
+            project(input_file, extract_memo, layout_memo, template)
+        except (SystemExit, Exception) as e:  # e.g. a file still being written
+            print(f"Regeneration failed: {type(e).__name__}: {e}")
+            return
+        print(f"Regenerated in {time.monotonic() - start:.2f}s")
+
+    extract_memo = {}
+    layout_memo = {}
+    template = FILE_OUTPUT.read_bytes() if FILE_OUTPUT.exists() else b""
+
+    last = scan()
+    regenerate()
+    print(f"Watching {input_file} for changes (Ctrl+C to stop)")
+
+    try:
+        while True:
+            time.sleep(WATCH_POLL_INTERVAL)
+            current = scan()
+            if current == last:
+                continue
+
+            # Debounce: wait until the files stop changing
+            changed_at = time.monotonic()
+            while time.monotonic() - changed_at < WATCH_DEBOUNCE:
+                time.sleep(WATCH_POLL_INTERVAL)
+                latest = scan()
+                if latest != current:
+                    current = latest
+                    changed_at = time.monotonic()
+
+            changed = [
+                p for p in current.keys() | last.keys() if current.get(p) != last.get(p)
+            ]
+            for p in last.keys() - current.keys():
+                extract_memo.pop(p, None)
+            last = current
+
+            print(f"Changed: {', '.join(sorted(str(p) for p in changed))}")
+            regenerate()
+    except KeyboardInterrupt:
+        print("Watch stopped")
+
+
+def main() -> None:
+    state = progress_state.get()
+    if PRINT_PROGRESS and (state is None or state["callback"] is None):
+        set_progress(print_progress)
+
+    if EXTRACT_CACHE_CLEAR:
+        clear_extract_cache()
+
+    if WATCH_INPUT:
+        if COLLECT_REGIONS:
+            exit("Watch mode follows FILE_INPUT, unset COLLECT_REGIONS")
+        watch_input(FILE_INPUT)
+        return
+
+    project(FILE_INPUT)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import projector  # noqa: E402
+from pptx.util import Inches  # noqa: E402
+
+SAMPLE_INPUT = ROOT / "data" / "sample_aws_resources.json"
+
+# Settings the layout depends on, pinned to the values the golden was recorded with
+PINNED_LAYOUT = {
+    "START_LEFT": Inches(0.1),
+    "START_TOP": Inches(0.1),
+    "ITEM_W": Inches(2),
+    "ITEM_H": Inches(0.95),
+    "ITEM_ICON_H": Inches(0.5),
+    "GROUP_W": Inches(2),
+    "GROUP_H": Inches(0.5),
+    "GROUP_TARGET_RATIO": 4 / 3,
+    "PAD_H": Inches(0.2),
+    "PAD_V": Inches(0.25),
+    "GAP_H": Inches(0.2),
+    "GAP_V": Inches(0.25),
+    "SPECIAL_ITEM_CATE": ["igw"],
+    "NETWORK_ROUTE_TABLE_KEY": "route_table_raw",
+    "RESOURCE_FILTER": None,
+    "GROUP_BY_TAG": None,
+    "ACCOUNT_LEVEL": False,
+    "LAYOUT_CACHE_DIR": None,
+}
+
+TOPOLOGIES = {
+    # name: synthetic_inventory arguments
+    "shared_vpc_az": dict(vpcs=2, azs=3, subnets=2, instances=2),
+    "rds_multi_az": dict(azs=3, subnets=1, instances=1, rds=2),
+    "igw": dict(vpcs=2, azs=2, subnets=2, instances=2, igw=True),
+    "empty_subnets": dict(vpcs=2, azs=2, subnets=3, instances=0, rds=1),
+    "load_balancers": dict(vpcs=2, azs=2, subnets=2, instances=3, elb=2),
+    "wide_subnet": dict(azs=1, subnets=1, instances=60),
+    "multi_region": dict(
+        regions=3, vpcs=3, azs=3, subnets=3, instances=4, rds=1, igw=True, elb=1
+    ),
+}
+
+
+def synthetic_inventory(
+    regions: int = 1,
+    vpcs: int = 1,
+    azs: int = 2,
+    subnets: int = 2,
+    instances: int = 2,
+    rds: int = 0,
+    igw: bool = False,
+    elb: int = 0,
+) -> list:
+    """
+    Build a deterministic input (same shape as FILE_INPUT) of regions x VPCs x
+    AZs x subnets, each subnet holding `instances` EC2 instances (0: empty).
+    - rds: RDS instances per VPC, with a DB subnet group in every AZ (multi-AZ)
+    - igw: an IGW per VPC with a public route table on every other subnet
+    - elb: load balancers per VPC targeting the first instances
+    """
+    data = []
+    for r in range(regions):
+        region = f"r{r}-east-1"
+        ec2, db, vpc_raw, subnet_raw, igw_raw, route_tables = [], [], [], [], [], []
+        lbs, target_groups, target_health = [], [], []
+        for v in range(vpcs):
+            vpc = f"vpc-{r}{v:04d}"
+            vpc_raw.append({"VpcId": vpc})
+            subnet_ids = []
+            for a in range(azs):
+                az = f"{region}{chr(97 + a)}"
+                for sn in range(subnets):
+                    subnet = f"subnet-{r}{v}{a}{sn:03d}"
+                    subnet_ids.append(subnet)
+                    subnet_raw.append(
+                        {"SubnetId": subnet, "VpcId": vpc, "AvailabilityZone": az}
+                    )
+                    reservation = []
+                    for i in range(instances):
+                        instance = f"i-{r}{v}{a}{sn}{i:04d}"
+                        reservation.append(
+                            {
+                                "InstanceId": instance,
+                                "VpcId": vpc,
+                                "SubnetId": subnet,
+                                "Placement": {"AvailabilityZone": az},
+                                "Tags": [
+                                    {"Key": "Name", "Value": f"web {instance}"},
+                                    {
+                                        "Key": "Environment",
+                                        "Value": ("prod", "dev")[i % 2],
+                                    },
+                                ],
+                            }
+                        )
+                    ec2.append(
+                        {"ReservationId": f"r-{subnet}", "Instances": reservation}
+                    )
+            if igw:
+                igw_id = f"igw-{r}{v}"
+                igw_raw.append(
+                    {
+                        "InternetGatewayId": igw_id,
+                        "Attachments": [{"State": "available", "VpcId": vpc}],
+                        "Tags": [],
+                    }
+                )
+                route_tables.append(
+                    {
+                        "RouteTableId": f"rtb-pub-{r}{v}",
+                        "VpcId": vpc,
+                        "Routes": [
+                            {"DestinationCidrBlock": "0.0.0.0/0", "GatewayId": igw_id}
+                        ],
+                        "Associations": [{"SubnetId": s} for s in subnet_ids[::2]],
+                    }
+                )
+                route_tables.append(
+                    {
+                        "RouteTableId": f"rtb-main-{r}{v}",
+                        "VpcId": vpc,
+                        "Routes": [{"GatewayId": "local"}],
+                        "Associations": [{"Main": True}],
+                    }
+                )
+            for d in range(rds):
+                db.append(
+                    {
+                        "DbiResourceId": f"db-{r}{v}{d}",
+                        "DBInstanceIdentifier": f"db{r}{v}{d}",
+                        "AvailabilityZone": f"{region}a",
+                        "DBSubnetGroup": {
+                            "VpcId": vpc,
+                            "Subnets": [
+                                {
+                                    "SubnetIdentifier": f"subnet-{r}{v}{a}000",
+                                    "SubnetAvailabilityZone": {
+                                        "Name": f"{region}{chr(97 + a)}"
+                                    },
+                                }
+                                for a in range(azs)
+                            ],
+                        },
+                    }
+                )
+            for e in range(elb):
+                arn = f"arn:aws:elasticloadbalancing:{region}:1:loadbalancer/app/lb{v}{e}/0"
+                tg = f"arn:aws:elasticloadbalancing:{region}:1:targetgroup/tg{v}{e}/0"
+                lbs.append(
+                    {
+                        "LoadBalancerArn": arn,
+                        "LoadBalancerName": f"lb{v}{e}",
+                        "VpcId": vpc,
+                    }
+                )
+                target_groups.append(
+                    {"TargetGroupArn": tg, "LoadBalancerArns": [arn], "VpcId": vpc}
+                )
+                targets = [f"i-{r}{v}0{sn}0000" for sn in range(min(subnets, 2))]
+                target_health.append(
+                    {
+                        "TargetGroupArn": tg,
+                        "TargetHealthDescriptions": [
+                            {"Target": {"Id": t}} for t in targets if instances
+                        ],
+                    }
+                )
+        data.append(
+            {
+                "region": region,
+                "collected_resources": {
+                    "ec2": ec2,
+                    "rds": db,
+                    "network": {
+                        "IGgateway_raw": igw_raw,
+                        "subnet_raw": subnet_raw,
+                        "vpc_raw": vpc_raw,
+                        "route_table_raw": route_tables,
+                    },
+                    "loadbalancer": {
+                        "lb_raw": lbs,
+                        "lb_target_groups": target_groups,
+                        "lb_target_health": target_health,
+                    },
+                    "s3": [],
+                    "ebs": [],
+                },
+            }
+        )
+    return data
+
+
+@pytest.fixture
+def pinned_layout(monkeypatch):
+    """Pin the layout settings, the golden does not follow the user configuration"""
+    for name, value in PINNED_LAYOUT.items():
+        monkeypatch.setattr(projector, name, value)
+    return projector
+
+
+@pytest.fixture
+def sample_data():
+    return projector.load_data(str(SAMPLE_INPUT))
+
+
+@pytest.fixture(params=["sample", *TOPOLOGIES])
+def inventory(request):
+    """(case name, input data) of the sample input and each synthetic topology"""
+    if request.param == "sample":
+        return request.param, projector.load_data(str(SAMPLE_INPUT))
+    return request.param, synthetic_inventory(**TOPOLOGIES[request.param])
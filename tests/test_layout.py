@@ -0,0 +1,95 @@
+"""
+Layout regression tests: every positioned node of the sample input and of the
+synthetic topologies is compared with tests/golden/layout.json.
+After an intended layout change, rewrite the golden with
+UPDATE_GOLDEN=1 python -m pytest tests/test_layout.py and commit it.
+The golden is not the baseline layout for every case:
+- shared_vpc_az and igw were recorded after the fix shifting moved subtrees
+  and keeping neighbour rows below their siblings
+- multi_region was recorded after the per-region layout split (each region
+  laid out on its own, for the region layout cache)
+The "sample" case (data/sample_aws_resources.json) only has 6 nodes, the
+synthetic topologies cover the larger layouts.
+"""
+
+import copy
+import json
+import os
+import tracemalloc
+from pathlib import Path
+
+GOLDEN_FILE = Path(__file__).parent / "golden" / "layout.json"
+
+# stage: peak allocated bytes, for each input (largest case about a quarter of it)
+ALLOCATION_BUDGETS = {
+    "extract": 1 * 2**20,
+    "group": 1 * 2**20,
+    "layout": 2 * 2**20,
+}
+
+
+def run_stages(projector, data: list) -> tuple:
+    """Return (positioned nodes, {stage: peak allocated bytes})"""
+    stages = [
+        ("extract", projector.extract_resources),
+        ("group", projector.generate_group_items_mapping),
+        ("layout", lambda g: projector.cal_region_position_mapping(g)),
+    ]
+    peaks = {}
+    result = data
+    for stage, func in stages:
+        stage_input = copy.deepcopy(result)  # Stages mutate their input
+        tracemalloc.start()
+        try:
+            result = func(stage_input)
+            peaks[stage] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, peaks
+
+
+def snapshot(positioned: list) -> list:
+    return [
+        [
+            n["id"],
+            n["position"]["left"],
+            n["position"]["top"],
+            n["style"]["width"],
+            n["style"]["height"],
+        ]
+        for n in positioned
+    ]
+
+
+def write_golden(golden: dict) -> None:
+    # One node per line, diffs of the golden file stay readable
+    cases_json = [
+        f"{json.dumps(name)}: [\n" + ",\n".join(json.dumps(r) for r in rows) + "\n]"
+        for name, rows in golden.items()
+    ]
+    GOLDEN_FILE.write_text("{\n" + ",\n".join(cases_json) + "\n}\n", encoding="utf-8")
+
+
+def test_layout_matches_golden(pinned_layout, inventory):
+    name, data = inventory
+    positioned, _ = run_stages(pinned_layout, data)
+    actual = snapshot(positioned)
+
+    golden = json.loads(GOLDEN_FILE.read_text(encoding="utf-8"))
+    if os.environ.get("UPDATE_GOLDEN"):
+        golden[name] = actual
+        write_golden(golden)
+        return
+
+    assert name in golden, f"no golden layout for {name}"
+    expected = {row[0]: row[1:] for row in golden[name]}
+    assert {row[0]: row[1:] for row in actual} == expected
+
+
+def test_stage_allocations(pinned_layout, inventory):
+    name, data = inventory
+    _, peaks = run_stages(pinned_layout, data)
+    over = {
+        stage: peak for stage, peak in peaks.items() if peak > ALLOCATION_BUDGETS[stage]
+    }
+    assert not over, f"{name}: peak allocation over budget {over}"
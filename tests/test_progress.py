@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+
+def run_layout(projector, data: list) -> list:
+    grouped = projector.generate_group_items_mapping(projector.extract_resources(data))
+    return projector.cal_region_position_mapping(grouped)
+
+
+def test_progress_is_per_thread(pinned_layout, sample_data):
+    both_registered = threading.Barrier(2)
+    events = {"cancelled": [], "running": []}
+    outcome = {}
+
+    def job(name: str, cancel: threading.Event) -> None:
+        pinned_layout.set_progress(events[name].append, cancel)
+        both_registered.wait()
+        try:
+            run_layout(pinned_layout, sample_data)
+            outcome[name] = "done"
+        except pinned_layout.RenderCancelled:
+            outcome[name] = "cancelled"
+
+    cancelled = threading.Event()
+    cancelled.set()
+    threads = [
+        threading.Thread(target=job, args=("cancelled", cancelled)),
+        threading.Thread(target=job, args=("running", threading.Event())),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outcome == {"cancelled": "cancelled", "running": "done"}
+    assert events["running"] and not events["cancelled"]
+
+
+def test_cancel_raises(pinned_layout, sample_data):
+    cancel = threading.Event()
+    cancel.set()
+    pinned_layout.set_progress(None, cancel)
+    try:
+        with pytest.raises(pinned_layout.RenderCancelled):
+            run_layout(pinned_layout, sample_data)
+    finally:
+        pinned_layout.set_progress()
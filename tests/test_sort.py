@@ -0,0 +1,125 @@
+"""
+sort_siblings regression tests: the single composite key sort must order
+siblings exactly like the previous multi-pass sort (previous_sort below).
+"""
+
+import random
+
+
+def previous_sort(nodes: list) -> list:
+    """Multi-pass sibling sort used by cal_position_mapping before sort_siblings"""
+
+    def total_span(node):
+        span = node.get("span", {})
+        return sum(sum(v) for v in span.values() if isinstance(v, list))
+
+    def has_only_default_span(node):
+        span = node.get("span", {})
+        return set(span.keys()) == {"default"}
+
+    def has_mixed_span(node):
+        span = node.get("span", {})
+        keys = list(span.keys())
+        return "default" in keys and len(keys) > 1
+
+    def has_nonempty_default(node):
+        span = node.get("span", {})
+        return bool(span.get("default"))
+
+    def parent_len(node):
+        return len(node.get("parentId", []))
+
+    def type_order(node):
+        t = node.get("type", "")
+        if t == "group":
+            return 0
+        if t == "item":
+            return 1
+        return 2
+
+    if not nodes:
+        return nodes
+
+    if all(has_only_default_span(n) for n in nodes):
+        return sorted(nodes, key=lambda n: (parent_len(n), -total_span(n)))
+
+    first_default_mixed = next(
+        (n for n in nodes if has_mixed_span(n) and has_nonempty_default(n)),
+        None,
+    )
+
+    others = [n for n in nodes if n is not first_default_mixed]
+    only_default_nodes = [n for n in others if has_only_default_span(n)]
+    non_default_nodes = [n for n in others if n not in only_default_nodes]
+
+    non_default_nodes.sort(
+        key=lambda n: (
+            parent_len(n),
+            type_order(n),
+            -total_span(n),
+        )
+    )
+
+    ordered = []
+    if first_default_mixed:
+        ordered.append(first_default_mixed)
+    ordered.extend(non_default_nodes)
+    ordered.extend(only_default_nodes)
+
+    return sorted(
+        ordered,
+        key=lambda n: (
+            parent_len(n),
+            type_order(n),
+            0 if n is first_default_mixed else 1,
+        ),
+    )
+
+
+def same_order(a: list, b: list) -> bool:
+    return [id(n) for n in a] == [id(n) for n in b]
+
+
+def test_sort_matches_previous_on_layout(pinned_layout, inventory, monkeypatch):
+    name, data = inventory
+    sort_siblings = pinned_layout.sort_siblings
+    calls = []
+
+    def checked_sort(nodes: list) -> list:
+        expected = previous_sort(list(nodes))
+        result = sort_siblings(nodes)
+        calls.append(same_order(result, expected))
+        return result
+
+    monkeypatch.setattr(pinned_layout, "sort_siblings", checked_sort)
+    grouped = pinned_layout.generate_group_items_mapping(
+        pinned_layout.extract_resources(data)
+    )
+    pinned_layout.cal_region_position_mapping(grouped)
+
+    assert calls, f"{name}: sort_siblings was not called"
+    assert all(calls), f"{name}: {calls.count(False)} sibling lists ordered differently"
+
+
+def test_sort_matches_previous_on_random_siblings(pinned_layout):
+    rng = random.Random(47)
+    for _ in range(2000):
+        nodes = []
+        for i in range(rng.randint(0, 12)):
+            keys = rng.sample(
+                ["default", "private_subnet", "public_subnet"], rng.randint(0, 3)
+            )
+            nodes.append(
+                {
+                    "id": f"n{i}",
+                    "type": rng.choice(["group", "item", "other"]),
+                    "parentId": [f"p{p}" for p in range(rng.randint(0, 2))],
+                    "span": {
+                        k: [rng.randint(0, 3) for _ in range(rng.randint(0, 3))]
+                        for k in keys
+                    },
+                }
+            )
+        assert same_order(
+            pinned_layout.sort_siblings(list(nodes)), previous_sort(list(nodes))
+        )